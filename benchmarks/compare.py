@@ -0,0 +1,57 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python benchmarks/compare.py baseline.json candidate.json [--threshold 10]
+
+Exits with status 1 when any p95 latency or peak memory grows, or throughput
+drops, by more than the threshold (percent).
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Tuple
+
+
+def _index(path: str) -> Dict[Tuple[str, int], dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {(run["backend"], run["concurrency"]): run for run in data["runs"]}
+
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old * 100.0 if old else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args(argv)
+
+    old, new = _index(args.baseline), _index(args.candidate)
+    regressions = 0
+    print(f"{'backend':>8} {'conc':>4}  {'metric':<16} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for key in sorted(set(old) & set(new)):
+        a, b = old[key], new[key]
+        rows = [
+            ("p50 ms", a["latency_ms"]["p50"], b["latency_ms"]["p50"], False),
+            ("p95 ms", a["latency_ms"]["p95"], b["latency_ms"]["p95"], True),
+            ("p99 ms", a["latency_ms"]["p99"], b["latency_ms"]["p99"], False),
+            ("throughput rps", a["throughput_rps"], b["throughput_rps"], True),
+            ("peak MB", a["memory"]["peak_mb"], b["memory"]["peak_mb"], True),
+        ]
+        for metric, x, y, gated in rows:
+            change = _change(x, y)
+            worse = -change if metric.startswith("throughput") else change
+            flag = ""
+            if gated and worse > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{key[0]:>8} {key[1]:>4}  {metric:<16} {x:>10.2f} {y:>10.2f} {change:>+7.1f}%{flag}")
+    for key in sorted(set(old) ^ set(new)):
+        print(f"{key[0]:>8} {key[1]:>4}  only in {'baseline' if key in old else 'candidate'}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
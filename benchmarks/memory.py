@@ -0,0 +1,133 @@
+"""Measure per-worker memory of the gunicorn deployment with and without preloading.
+
+Starts gunicorn from src/ with gunicorn.conf.py twice (DEVREF_PRELOAD=1 and 0),
+waits until every worker serves with the embedding model, sends some warm-up
+traffic, then reads /proc/<pid>/smaps_rollup of each worker. RSS counts shared
+pages in every process; PSS splits them between the processes sharing them and
+USS is what a worker holds alone, so the saving shows up in PSS and USS.
+
+    python benchmarks/memory.py --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+
+
+def smaps_rollup(pid: int) -> Dict[str, float]:
+    """RSS, PSS and USS of a process in MB (Linux only)."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "uss_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_json(url: str, data: dict = None) -> dict:
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+
+
+def measure(preload: bool, workers: int, threads: int, warmup: int, startup_timeout: float) -> dict:
+    port = free_port()
+    env = dict(os.environ, DEVREF_PRELOAD="1" if preload else "0", DEVREF_WORKERS=str(workers),
+               DEVREF_THREADS=str(threads), DEVREF_BIND=f"127.0.0.1:{port}")
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"], cwd=SRC,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        # Every worker must answer with the model loaded; a long run of such answers covers all of them.
+        streak, deadline = 0, time.time() + startup_timeout
+        while streak < 4 * workers:
+            if time.time() > deadline or proc.poll() is not None:
+                raise RuntimeError(f"gunicorn (preload={preload}) did not become ready")
+            try:
+                status = get_json(f"{base}/ready")
+                streak = streak + 1 if status.get("reranker") == "embedding" or not status.get("sbert_available") \
+                    else 0
+            except OSError:
+                streak = 0
+                time.sleep(0.2)
+        ready_s = time.perf_counter() - started
+        for i in range(warmup):
+            get_json(f"{base}/process-comment", {"comment": f"launch this in a coroutine instead of blocking {i}",
+                                                 "settings": {"sources": ["internal"]}})
+        pids = children(proc.pid)
+        per_worker = [smaps_rollup(pid) for pid in pids]
+        master = smaps_rollup(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+    def mean(key):
+        return round(sum(w[key] for w in per_worker) / len(per_worker), 1)
+
+    return {
+        "preload": preload,
+        "workers": len(per_worker),
+        "ready_s": round(ready_s, 2),
+        "master": master,
+        "worker_mean": {key: mean(key) for key in ("rss_mb", "pss_mb", "uss_mb")},
+        "total_pss_mb": round(master["pss_mb"] + sum(w["pss_mb"] for w in per_worker), 1),
+        "per_worker": per_worker,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--warmup", type=int, default=50, help="requests sent before measuring")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--out", default=None, help="output JSON (default: benchmarks/results/memory-<ts>.json)")
+    args = parser.parse_args(argv)
+
+    runs = [measure(preload, args.workers, args.threads, args.warmup, args.startup_timeout) for preload in (True, False)]
+    print(f"{'mode':<10} {'workers':>7} {'ready s':>8} {'RSS/worker':>11} {'PSS/worker':>11} {'USS/worker':>11} "
+          f"{'total PSS':>10}")
+    for run in runs:
+        w = run["worker_mean"]
+        print(f"{'preload' if run['preload'] else 'no preload':<10} {run['workers']:>7} {run['ready_s']:>8.1f} "
+              f"{w['rss_mb']:>9.0f}MB {w['pss_mb']:>9.0f}MB {w['uss_mb']:>9.0f}MB {run['total_pss_mb']:>8.0f}MB")
+
+    out = args.out or os.path.join(HERE, "results", time.strftime("memory-%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "runs": runs}, f, indent=2)
+    print(f"wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
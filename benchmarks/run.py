@@ -0,0 +1,281 @@
+"""Replay review comments through Recommender.process and report latency, throughput and memory.
+
+Each reranker backend runs in its own subprocess so that its peak RSS is
+measured in isolation. External providers are replaced by offline stand-ins
+with injected latency (see standins.py). Stage timings are read from the
+pipeline's own breakdown, so they are available with --no-debug too, which
+sends ordinary requests through the response and semantic caches. A short
+sequential pass under tracemalloc reports the peak memory allocated in each
+stage. Results are written as JSON and can be compared between runs with
+compare.py.
+
+    python benchmarks/run.py --backends lexical,torch --concurrency 1,8 --requests 200
+    python benchmarks/compare.py benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    values = sorted(values)
+
+    def pct(p):
+        return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+    return {"p50": round(pct(50), 3), "p95": round(pct(95), 3), "p99": round(pct(99), 3),
+            "mean": round(sum(values) / len(values), 3)}
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def stage_memory(one, modules, requests: int) -> Dict[str, Dict[str, float]]:
+    """Peak memory allocated inside each pipeline stage, over ``requests`` sequential requests.
+
+    The ``stage`` context manager of ``modules`` is wrapped to read
+    tracemalloc's peak, which covers Python and NumPy allocations but not
+    torch or onnxruntime internals. Requests run one at a time, so peaks are
+    not mixed up between requests.
+    """
+    if requests <= 0:
+        return {}
+    peaks: Dict[str, List[float]] = {}
+    originals = {module: module.stage for module in modules}
+
+    def wrap(original):
+        @contextmanager
+        def traced_stage(name: str):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                with original(name):
+                    yield
+            finally:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                peaks.setdefault(name, []).append(peak / 2 ** 20)
+        return traced_stage
+
+    tracemalloc.start()
+    try:
+        for module, original in originals.items():
+            module.stage = wrap(original)
+        for i in range(requests):
+            one(i)
+    finally:
+        for module, original in originals.items():
+            module.stage = original
+        tracemalloc.stop()
+    return {name: {"peak_mb_mean": round(sum(v) / len(v), 3), "peak_mb_max": round(max(v), 3)}
+            for name, v in sorted(peaks.items())}
+
+
+def run_worker(args) -> dict:
+    """Benchmark one backend in this process; called in a subprocess by main()."""
+    sys.path.insert(0, SRC)
+    sys.path.insert(0, HERE)
+    if args.backend != "lexical":
+        os.environ["DEVREF_RERANKER_BACKEND"] = args.backend
+    memory = {"baseline_mb": round(rss_mb(), 1)}
+
+    import yaml
+    from core import processor, rerank_base
+    from core.aio import run_sync
+    from core.cache import embedding_cache, response_cache, result_cache, semantic_cache
+    from core.metrics import request_timings
+    from core.provider import load_internal_provider
+    from core.registry import registry
+    from standins import LatencyModel, StandInGoogleProvider, StandInYouTubeProvider, load_recorded
+
+    memory["after_import_mb"] = round(rss_mb(), 1)
+    load_internal_provider()
+    reranker = None
+    if args.backend == "lexical":
+        processor.SBERT_AVAILABLE = False
+    else:
+        from core.ann import get_ann_index
+        from core.embed_index import get_corpus_embeddings
+        reranker = registry.get_reranker()
+        # As at app startup: requests never build the corpus index themselves.
+        get_ann_index(get_corpus_embeddings(reranker, provider=load_internal_provider()))
+    memory["after_warmup_mb"] = round(rss_mb(), 1)
+
+    if args.cold:
+        result_cache.memory.maxsize = 0
+        embedding_cache.max_bytes = 0
+        response_cache.ttl = 0
+        semantic_cache.ttl = 0
+
+    recorded = load_recorded(args.recorded)
+    google = StandInGoogleProvider(LatencyModel(args.latency_ms, args.latency_p95_ms, seed=1), recorded.get("google"))
+    youtube = StandInYouTubeProvider(LatencyModel(args.latency_ms, args.latency_p95_ms, seed=2),
+                                     recorded.get("youtube"))
+
+    class BenchRecommender(processor.Recommender):
+        def __init__(self):
+            super().__init__(reranker=reranker)
+
+        def _resolve_sources(self, names, internal_mode="topics", nprobe=None):
+            providers = []
+            for n in names:
+                if n == "google":
+                    providers.append(google)
+                elif n == "youtube":
+                    providers.append(youtube)
+                else:
+                    providers.extend(super()._resolve_sources([n], internal_mode, nprobe))
+            return providers
+
+    with open(args.comments, "r", encoding="utf-8") as f:
+        corpus = yaml.safe_load(f)
+    # Debug requests bypass the response and semantic caches; --no-debug measures the cached serving path.
+    settings = {"sources": args.sources.split(","), "num_recommendations": 3, "debug": not args.no_debug,
+                "latency_budget_ms": args.budget_ms}
+    if args.internal_search:
+        settings["internal_search"] = args.internal_search
+
+    async def timed(payload: dict):
+        await BenchRecommender().aprocess(payload)
+        # aprocess starts the breakdown in this context; stages running in its tasks and threads add to it.
+        return dict(request_timings() or {})
+
+    def one(i: int, debug: bool = False):
+        item = corpus[i % len(corpus)]
+        payload = {"comment": item["comment"], "tags": item.get("tags") or [],
+                   "settings": dict(settings, debug=True) if debug else settings}
+        start = time.perf_counter()
+        timings = run_sync(timed(payload))
+        return (time.perf_counter() - start) * 1000.0, timings
+
+    for i in range(min(args.warmup, len(corpus))):
+        one(i)
+
+    runs = []
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        latencies: List[float] = []
+        stages: Dict[str, List[float]] = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for elapsed, timings in pool.map(one, range(args.requests)):
+                latencies.append(elapsed)
+                for name, ms in timings.items():
+                    stages.setdefault(name, []).append(ms)
+        wall = time.perf_counter() - start
+        runs.append({
+            "backend": args.backend,
+            "concurrency": concurrency,
+            "requests": args.requests,
+            "throughput_rps": round(args.requests / wall, 2),
+            "latency_ms": percentiles(latencies),
+            "stages_ms": {name: percentiles(values) for name, values in sorted(stages.items())},
+            "memory": dict(memory, after_run_mb=round(rss_mb(), 1), peak_mb=round(peak_rss_mb(), 1)),
+        })
+    # Last, so tracing neither slows the timed runs nor warms the response caches for them; debug
+    # requests bypass those caches, so every stage actually runs.
+    stages = stage_memory(lambda i: one(i, debug=True), [processor, rerank_base], args.stage_memory_requests)
+    for run in runs:
+        run["memory"]["stages"] = stages
+    return {"runs": runs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="lexical,torch",
+                        help="comma-separated reranker backends: lexical, torch, onnx")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests before measuring")
+    parser.add_argument("--sources", default="internal,google,youtube")
+    parser.add_argument("--internal-search", default=None, help="topics or vector")
+    parser.add_argument("--latency-ms", type=float, default=250.0, help="median injected provider latency")
+    parser.add_argument("--latency-p95-ms", type=float, default=600.0, help="p95 injected provider latency")
+    parser.add_argument("--budget-ms", type=float, default=4000.0, help="per-request latency budget")
+    parser.add_argument("--cold", action="store_true", help="disable the result, embedding and response caches")
+    parser.add_argument("--no-debug", action="store_true",
+                        help="send non-debug requests, which are served through the response and semantic caches")
+    parser.add_argument("--stage-memory-requests", type=int, default=20,
+                        help="sequential requests traced for per-stage memory (0 disables)")
+    parser.add_argument("--comments", default=os.path.join(HERE, "comments.yaml"))
+    parser.add_argument("--recorded", default=None, help="JSON of recorded provider responses")
+    parser.add_argument("--out", default=None, help="output JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        json.dump(run_worker(args), sys.stdout)
+        return
+
+    worker_args = ["--concurrency", args.concurrency, "--requests", str(args.requests),
+                   "--warmup", str(args.warmup), "--sources", args.sources,
+                   "--latency-ms", str(args.latency_ms), "--latency-p95-ms", str(args.latency_p95_ms),
+                   "--budget-ms", str(args.budget_ms), "--comments", args.comments,
+                   "--stage-memory-requests", str(args.stage_memory_requests)]
+    if args.internal_search:
+        worker_args += ["--internal-search", args.internal_search]
+    if args.recorded:
+        worker_args += ["--recorded", args.recorded]
+    if args.cold:
+        worker_args.append("--cold")
+    if args.no_debug:
+        worker_args.append("--no-debug")
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "git_rev": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                      text=True).stdout.strip(),
+            "args": vars(args),
+        },
+        "runs": [],
+    }
+    for backend in args.backends.split(","):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", "--backend", backend] + worker_args,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"[{backend}] failed:\n{proc.stderr}", file=sys.stderr)
+            continue
+        for run in json.loads(proc.stdout)["runs"]:
+            results["runs"].append(run)
+            lat = run["latency_ms"]
+            print(f"[{backend:>7}] c={run['concurrency']:<3} {run['throughput_rps']:>8.1f} req/s  "
+                  f"p50={lat['p50']:.1f}ms p95={lat['p95']:.1f}ms p99={lat['p99']:.1f}ms  "
+                  f"peak={run['memory']['peak_mb']:.0f}MB")
+
+    out = args.out or os.path.join(HERE, "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Offline stand-ins for the external search providers.
+
+They answer through the same async interface as GoogleProvider and
+YouTubeProvider, with injected latency, so runs are reproducible and need
+neither network access nor API quota. Results come from a recorded JSON
+file (``{"google": {"<query>": [{"title", "url", "snippet"}, ...]}, ...}``)
+when one is given, and are otherwise synthesized deterministically from the
+query.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+from typing import Dict, List, Optional
+
+from core.provider import GoogleProvider, YouTubeProvider
+from core.search import SearchResult
+
+
+class LatencyModel:
+    """Log-normal latency with the given median and p95, in milliseconds."""
+
+    def __init__(self, median_ms: float = 250.0, p95_ms: float = 600.0, seed: int = 0):
+        self.mu = math.log(max(median_ms, 1e-3))
+        # p95 of a log-normal is exp(mu + 1.645 * sigma)
+        self.sigma = max(math.log(max(p95_ms, median_ms) / max(median_ms, 1e-3)) / 1.645, 0.0)
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        if not self.sigma:
+            return math.exp(self.mu) / 1000.0
+        return self._rng.lognormvariate(self.mu, self.sigma) / 1000.0
+
+
+def _synthetic(source: str, query: str, k: int) -> List[SearchResult]:
+    digest = hashlib.sha1(f"{source}|{query}".encode("utf-8")).hexdigest()
+    words = query.split()
+    out = []
+    for i in range(k):
+        slug = f"{digest[:8]}-{i}"
+        title = " ".join(words[i % max(len(words), 1):] + words[:i % max(len(words), 1)]).title() or slug
+        if source == "youtube":
+            url = f"https://www.youtube.com/watch?v={slug}"
+        else:
+            url = f"https://example.com/{'-'.join(words[:4]).lower()}/{slug}"
+        out.append(SearchResult(title=f"{title} ({i + 1})", url=url,
+                                snippet=f"{query}: walkthrough part {i + 1} with examples and pitfalls.",
+                                source=source))
+    return out
+
+
+class _StandIn:
+    def _init_standin(self, latency: LatencyModel, recorded: Optional[Dict[str, List[dict]]]):
+        self.latency = latency
+        self.recorded = recorded or {}
+        self.calls = 0
+
+    async def asearch(self, query: str, k: int = 10) -> List[SearchResult]:
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        items = self.recorded.get(query)
+        if items is not None:
+            return [SearchResult(source=self.name, **{f: it.get(f, "") for f in ("title", "url", "snippet")})
+                    for it in items[:k]]
+        return _synthetic(self.name, query, k)
+
+
+class StandInGoogleProvider(_StandIn, GoogleProvider):
+    def __init__(self, latency: LatencyModel, recorded: Optional[Dict[str, List[dict]]] = None):
+        GoogleProvider.__init__(self, api_key="offline", cse_id="offline")
+        self._init_standin(latency, recorded)
+
+
+class StandInYouTubeProvider(_StandIn, YouTubeProvider):
+    def __init__(self, latency: LatencyModel, recorded: Optional[Dict[str, List[dict]]] = None):
+        YouTubeProvider.__init__(self, api_key="offline")
+        self._init_standin(latency, recorded)
+
+
+def load_recorded(path: Optional[str]) -> Dict[str, Dict[str, List[dict]]]:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
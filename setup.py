@@ -13,8 +13,14 @@ setup(
         "httpx",
         "pydantic",
         "sentence-transformers",
+        "numpy",
         "pyyaml"
     ],
+    extras_require={
+        "onnx": ["onnxruntime", "tokenizers"],
+        "serve": ["gunicorn"],
+        "test": ["pytest"],
+    },
     python_requires=">=3.9",
     include_package_data=True,
     zip_safe=False,
@@ -1,24 +1,76 @@
+import time
+
+_import_start = time.perf_counter()
+
 import json
 
-from flask import Flask, request
+from flask import Flask, Response, request, stream_with_context
 from flask_cors import CORS
 
-from core.processor import Recommender
+from core.aio import iter_sync
+from core.ann import get_ann_index
+from core.embed_index import get_corpus_embeddings
+from core.metrics import metrics, record_startup, startup_timings
+from core.nlp import extract_topics
+from core.processor import DEFAULT_INTERNAL_STORE, Recommender, SBERT_AVAILABLE
+from core.fts_store import load_fts_provider
+from core.provider import load_internal_provider
+from core.registry import DEFAULT_MODEL_LOAD, registry
 
 app = Flask(__name__)
 CORS(app)
 
-if __name__ == '__main__':
-    app.run(debug=True)
+record_startup("imports", time.perf_counter() - _import_start)
 
+# Parse/index the internal dataset once per process, before serving traffic. The
+# on-disk full-text store is only opened; it is never loaded into memory.
+_phase_start = time.perf_counter()
+if DEFAULT_INTERNAL_STORE == "fts":
+    internal_provider = None
+    load_fts_provider()
+else:
+    internal_provider = load_internal_provider()
+record_startup("dataset", time.perf_counter() - _phase_start)
+_phase_start = time.perf_counter()
+extract_topics("")  # compiles the vocabulary matcher
+record_startup("matcher", time.perf_counter() - _phase_start)
+
+
+def _build_corpus_embeddings():
+    if internal_provider is not None:
+        corpus = get_corpus_embeddings(registry.get_reranker(), provider=internal_provider)
+        # Trained here, before gunicorn forks, so workers share it and requests never build it.
+        get_ann_index(corpus)
 
-@app.route('/process-comment', methods=['POST'])
-def process_comment():
-    data = request.json
-    comment = data.get('comment', '')
-    tags = data.get('tags', [])
-    settings = data.get('settings', {})
 
+# The embedding model takes seconds to import and load; by default requests are
+# ranked lexically until it is ready.
+if SBERT_AVAILABLE:
+    if DEFAULT_MODEL_LOAD == "blocking":
+        _phase_start = time.perf_counter()
+        if registry.warmup():
+            _build_corpus_embeddings()
+        record_startup("model", time.perf_counter() - _phase_start)
+    else:
+        registry.load_in_background(on_loaded=_build_corpus_embeddings)
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = registry.status()
+    # The embedding reranker is used once the model and its corpus embeddings are ready (see Recommender).
+    embedding = SBERT_AVAILABLE and registry.is_loaded() and not registry.is_loading()
+    # Requests are ranked lexically until then, so the app is always ready; it is degraded
+    # when the model failed to load and lexical ranking is all it will ever do.
+    status["ready"] = True
+    status["degraded"] = SBERT_AVAILABLE and not embedding and not registry.is_loading()
+    status["sbert_available"] = SBERT_AVAILABLE
+    status["reranker"] = "embedding" if embedding else "lexical"
+    status["startup_ms"] = dict(startup_timings)
+    return json.dumps(status), 200, {"Content-Type": "application/json"}
+
+
+def _recommender(settings: dict) -> Recommender:
     google_cfg = {
         "api_key": settings.get("google_api_key"),
         "cse_id": settings.get("google_cse_key")
@@ -26,7 +78,59 @@ def process_comment():
     youtube_cfg = {
         "api_key": settings.get("youtube_api_key")
     }
+    return Recommender(google_cfg=google_cfg, youtube_cfg=youtube_cfg)
+
 
-    recommender = Recommender(google_cfg=google_cfg, youtube_cfg=youtube_cfg)
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@app.route('/process-comment', methods=['POST'])
+def process_comment():
+    data = request.json
+    settings = data.get('settings', {})
+
+    recommender = _recommender(settings)
     response_data = recommender.process(data)
     return json.dumps({"response": response_data})
+
+
+@app.route('/process-comment/stream', methods=['POST'])
+def process_comment_stream():
+    data = request.json
+    settings = data.get('settings', {})
+
+    recommender = _recommender(settings)
+
+    def events():
+        for event in iter_sync(recommender.astream(data)):
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/process-comments', methods=['POST'])
+def process_comments():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _bad_request("expected a JSON object")
+    settings = data.get('settings') or {}
+    if not isinstance(settings, dict):
+        return _bad_request("settings must be an object")
+
+    recommender = _recommender(settings)
+    try:
+        response_data = recommender.process_batch(data)
+    except ValueError as e:
+        return _bad_request(str(e))
+    return json.dumps({"response": response_data})
+
+
+def _bad_request(message: str):
+    return json.dumps({"error": message}), 400, {"Content-Type": "application/json"}
+
+
+if __name__ == '__main__':
+    app.run(debug=True)
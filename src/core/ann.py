@@ -0,0 +1,130 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_NPROBE = int(os.getenv("DEVREF_ANN_NPROBE", "8"))
+# Below this many vectors an exact scan is as fast as probing lists.
+FLAT_THRESHOLD = int(os.getenv("DEVREF_ANN_FLAT_THRESHOLD", "4096"))
+
+
+class IVFFlatIndex:
+    """Inverted-file index over L2-normalized vectors, scored by inner product.
+
+    Vectors are partitioned into ``nlist`` k-means cells; a query scans only
+    the ``nprobe`` cells whose centroids are closest. Raising ``nprobe``
+    trades latency for recall; ``nprobe >= nlist`` is an exact search.
+    """
+
+    def __init__(self, vectors: np.ndarray, nlist: Optional[int] = None, n_iter: int = 10, seed: int = 0,
+                 centroids: Optional[np.ndarray] = None, assign: Optional[np.ndarray] = None):
+        self.vectors = vectors
+        n = vectors.shape[0]
+        if n < FLAT_THRESHOLD:
+            nlist = 1
+        elif nlist is None:
+            nlist = len(centroids) if centroids is not None else int(4 * np.sqrt(n))
+        self.nlist = max(1, min(nlist, n))
+        if self.nlist == 1:
+            self.centroids = np.zeros((1, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+            self.lists = [np.arange(n)]
+            self.assign = np.zeros(n, dtype=np.int64)
+            return
+        if centroids is not None and len(centroids) == self.nlist:
+            # Reuse a previous index's cells. ``assign`` may carry the cell of every vector
+            # already placed in them (-1 for the rest); only the others are assigned.
+            self.centroids = centroids
+            if assign is not None and len(assign) == n:
+                assign = assign.copy()
+                todo = np.flatnonzero(assign < 0)
+                if len(todo):
+                    assign[todo] = self._assign(self.vectors[todo])
+            else:
+                assign = self._assign(self.vectors)
+        else:
+            self.centroids = self._train(n_iter, seed)
+            assign = self._assign(self.vectors)
+        self.assign = assign
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+
+    def _assign(self, x: np.ndarray, chunk: int = 8192) -> np.ndarray:
+        out = np.empty(x.shape[0], dtype=np.int64)
+        for start in range(0, x.shape[0], chunk):
+            out[start:start + chunk] = np.argmax(np.asarray(x[start:start + chunk]) @ self.centroids.T, axis=1)
+        return out
+
+    def _train(self, n_iter: int, seed: int) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        n = self.vectors.shape[0]
+        sample_size = min(n, 64 * self.nlist)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+        self.centroids = sample[rng.choice(sample_size, self.nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = self._assign(sample)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=self.nlist)
+            sums = np.zeros_like(self.centroids)
+            nonempty = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+            sums[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+            empty = counts == 0
+            # Re-seed empty cells from random points so every list stays useful.
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            self.centroids = sums / np.maximum(norms, 1e-12)
+        return self.centroids
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: int = DEFAULT_NPROBE) -> List[Tuple[int, float]]:
+        if self.nlist == 1:
+            cand = self.lists[0]
+            sims = np.asarray(self.vectors) @ query
+        else:
+            nprobe = max(1, min(nprobe, self.nlist))
+            cells = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            # Sorted row ids keep reads from the memory-mapped matrix sequential.
+            cand = np.sort(np.concatenate([self.lists[c] for c in cells]))
+            sims = np.asarray(self.vectors[cand]) @ query
+        k = min(k, len(cand))
+        if k <= 0:
+            return []
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(int(cand[i]), float(sims[i])) for i in top]
+
+
+_indexes: Dict[Tuple[str, Optional[int]], IVFFlatIndex] = {}
+_lock = threading.Lock()
+
+
+def get_ann_index(corpus, nlist: Optional[int] = None, build: bool = True) -> Optional[IVFFlatIndex]:
+    """Build (once per corpus digest) the ANN index over a CorpusEmbeddings matrix.
+
+    Training takes seconds on a large corpus, so it happens at startup and on
+    dataset reloads; request paths pass ``build=False`` and get None until the
+    index exists.
+    """
+    key = (corpus.digest, nlist)
+    index = _indexes.get(key)
+    if index is None and build:
+        with _lock:
+            index = _indexes.get(key)
+            if index is None:
+                stale = [k for k in _indexes if k[0] != corpus.digest]
+                # After a dataset edit, keep the old cells unless the corpus size moved a lot.
+                previous = _indexes.get(stale[-1]) if stale else None
+                centroids = assign = None
+                if previous is not None and previous.nlist > 1 and \
+                        0.5 <= corpus.vectors.shape[0] / max(previous.vectors.shape[0], 1) <= 2.0:
+                    centroids = previous.centroids
+                    base_rows = getattr(corpus, "base_rows", None)
+                    if base_rows is not None and corpus.base_digest == stale[-1][0]:
+                        # Entries carried over from the previous corpus stay in their cells.
+                        assign = np.where(base_rows >= 0, previous.assign[np.maximum(base_rows, 0)], -1)
+                for k in stale:
+                    del _indexes[k]
+                index = _indexes[key] = IVFFlatIndex(corpus.vectors, nlist=nlist, centroids=centroids,
+                                                     assign=assign)
+    return index
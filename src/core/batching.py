@@ -0,0 +1,114 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_BATCH = int(os.getenv("DEVREF_MICROBATCH_MAX_BATCH", "128"))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("DEVREF_MICROBATCH_MAX_WAIT_MS", "2"))
+
+
+class MicroBatcher:
+    """Coalesce encode jobs from concurrent requests into batched calls on one worker.
+
+    Callers submit a list of texts and block on a future. The worker takes the
+    first queued job, drains whatever else is already waiting, and then waits
+    at most ``max_wait_ms`` for more until ``max_batch`` texts are collected.
+    It runs ``encode_fn`` once on the concatenation and hands each caller its
+    slice of rows. A job that would push the batch past ``max_batch`` is held
+    over to start the next one; a single job larger than ``max_batch`` runs
+    on its own.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch: int = DEFAULT_MAX_BATCH,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        # Job taken from the queue that did not fit the previous batch; only the worker touches it.
+        self._held: Optional[Tuple[List[str], Future]] = None
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+        self.texts = 0
+
+    def _ensure_worker(self):
+        # The worker thread does not survive fork(); restart it in each child.
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._held = None
+                self._worker = threading.Thread(target=self._run, name="devref-encoder", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def submit(self, texts: Sequence[str]) -> Future:
+        future: Future = Future()
+        texts = list(texts)
+        if not texts:
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+        self._ensure_worker()
+        self._queue.put((texts, future))
+        return future
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def _collect(self) -> List[Tuple[List[str], Future]]:
+        jobs = [self._held if self._held is not None else self._queue.get()]
+        self._held = None
+        size = len(jobs[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if size + len(job[0]) > self.max_batch:
+                self._held = job
+                break
+            jobs.append(job)
+            size += len(job[0])
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._collect()
+            texts = [t for job_texts, _ in jobs for t in job_texts]
+            try:
+                vectors = self.encode_fn(texts)
+            except BaseException as e:
+                for _, future in jobs:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.jobs += len(jobs)
+            self.texts += len(texts)
+            start = 0
+            for job_texts, future in jobs:
+                future.set_result(vectors[start:start + len(job_texts)])
+                start += len(job_texts)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "texts": self.texts,
+            "queue_depth": self._queue.qsize(),
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
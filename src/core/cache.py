@@ -0,0 +1,465 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics import metrics
+from .quota import QUOTA_FALLBACKS, QuotaExceeded, UpstreamError
+from .search import SearchResult
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire, with an optional stale window.
+
+    ``get`` returns ``(value, fresh)``; an entry past its TTL but still inside
+    its stale window is returned with ``fresh=False`` so callers can serve it
+    while refreshing in the background. ``allow_expired`` also returns entries
+    past the stale window.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, allow_expired: bool = False) -> Optional[Tuple[Any, bool]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            # Expired entries stay until LRU eviction, as a last resort when the source is unavailable.
+            if entry is None or (entry[2] <= now and not allow_expired):
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1] > now
+
+    def set(self, key: Hashable, value: Any, ttl: float, stale: float = 0.0):
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + ttl, now + ttl + stale)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteResultStore:
+    """On-disk backing for ResultCache so cached results survive restarts.
+
+    Rows expired for more than ``retain`` seconds are deleted when the store
+    is opened and after every ``purge_every`` writes. Until then they remain
+    available as a fallback when a provider is out of quota or failing.
+    """
+
+    def __init__(self, path: str, retain: float = 86400.0, purge_every: int = 1000):
+        self.path = path
+        self.retain = retain
+        self.purge_every = max(1, purge_every)
+        self._lock = threading.Lock()
+        self._conn_pid: Optional[int] = None
+        self._writes = 0
+        self._connect()
+        self.purge(time.time() - retain)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+        self._conn_pid = os.getpid()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # A connection opened before fork() must not be used by the child.
+        if self._conn_pid != os.getpid():
+            self._connect()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[List[dict], float]]:
+        with self._lock:
+            row = self.conn.execute("SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: List[dict], expires: float):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)",
+                               (key, json.dumps(value), expires))
+            self._writes += 1
+            due = self._writes % self.purge_every == 0
+        if due:
+            self.purge(time.time() - self.retain)
+
+    def purge(self, before: float):
+        with self._lock:
+            self.conn.execute("DELETE FROM results WHERE expires < ?", (before,))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class ResultCache:
+    """Provider-level search result cache keyed by (provider, normalized query, k).
+
+    Entries live in an in-memory LRU and, when ``db_path`` is set, in SQLite.
+    With ``stale_while_revalidate`` > 0, expired entries are still served for
+    that many seconds while a single background refresh replaces them.
+    """
+
+    def __init__(self, maxsize: int = 2048, default_ttl: float = 3600.0, ttls: Optional[Dict[str, float]] = None,
+                 db_path: Optional[str] = None, stale_while_revalidate: float = 0.0, db_retain: float = 86400.0):
+        self.memory = TTLCache(maxsize)
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.stale_while_revalidate = stale_while_revalidate
+        self.store = SQLiteResultStore(db_path, retain=db_retain) if db_path else None
+        self._refreshing = set()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, provider: str, what: str):
+        with self._stats_lock:
+            counters = self._stats.setdefault(provider, {"hits": 0, "misses": 0, "stale": 0, "fallback": 0})
+            counters[what] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._stats_lock:
+            return {name: dict(counters) for name, counters in self._stats.items()}
+
+    def key(self, provider, query: str, k: int) -> str:
+        namespace = getattr(provider, "cache_namespace", None) or ""
+        return f"{provider.name}|{namespace}|{k}|{normalize_query(query)}"
+
+    def ttl(self, provider_name: str) -> float:
+        return self.ttls.get(provider_name, self.default_ttl)
+
+    async def lookup(self, key: str, provider_name: str,
+                     allow_expired: bool = False) -> Optional[Tuple[List[SearchResult], bool]]:
+        hit = self.memory.get(key, allow_expired)
+        if hit is not None:
+            return hit
+        if self.store is None:
+            return None
+        # SQLite calls block; keep them off the shared event loop.
+        row = await asyncio.to_thread(self.store.get, key)
+        if row is None:
+            return None
+        value, expires = row
+        remaining = expires - time.time()
+        if remaining + self.stale_while_revalidate <= 0:
+            if allow_expired:
+                return [SearchResult(**r) for r in value], False
+            return None
+        results = [SearchResult(**r) for r in value]
+        # Promote into memory with whatever freshness it has left.
+        self.memory.set(key, results, max(remaining, 0.0), self.stale_while_revalidate + min(remaining, 0.0))
+        return results, remaining > 0
+
+    async def store_results(self, key: str, provider_name: str, results: List[SearchResult]):
+        ttl = self.ttl(provider_name)
+        self.memory.set(key, results, ttl, self.stale_while_revalidate)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.set, key, [r.model_dump() for r in results], time.time() + ttl)
+
+    async def get_or_fetch(self, provider, query: str, k: int, fetch: Callable[[], Awaitable[List[SearchResult]]],
+                           on_fallback: Optional[Callable[[], None]] = None) -> List[SearchResult]:
+        name = provider.name
+        key = self.key(provider, query, k)
+        cached = await self.lookup(key, name)
+        if cached is not None:
+            results, fresh = cached
+            if fresh:
+                self._count(name, "hits")
+                return results
+            self._count(name, "stale")
+            if key not in self._refreshing:
+                self._refreshing.add(key)
+                asyncio.ensure_future(self._refresh(key, name, fetch))
+            return results
+        self._count(name, "misses")
+        try:
+            results = await fetch()
+        except (QuotaExceeded, UpstreamError):
+            # Out of quota or the API is failing: an outdated answer beats none.
+            expired = await self.lookup(key, name, allow_expired=True)
+            if expired is None:
+                raise
+            self._count(name, "fallback")
+            QUOTA_FALLBACKS.inc(provider=name, to="cache")
+            if on_fallback is not None:
+                on_fallback()
+            return expired[0]
+        # Never cache an empty answer.
+        if results:
+            await self.store_results(key, name, results)
+        return results
+
+    async def _refresh(self, key: str, provider_name: str, fetch: Callable[[], Awaitable[List[SearchResult]]]):
+        try:
+            results = await fetch()
+            if results:
+                await self.store_results(key, provider_name, results)
+        except Exception:
+            pass
+        finally:
+            self._refreshing.discard(key)
+
+
+class SingleFlight:
+    """Runs one computation per key at a time and briefly remembers its result.
+
+    Callers that arrive while a computation for their key is in flight await
+    the same future; callers that arrive within ``ttl`` seconds after it
+    finished get the stored result. The computation runs as its own task, so
+    a caller that gives up does not cancel it for the others.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 30.0):
+        self.results = TTLCache(maxsize)
+        self.ttl = ttl
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._stats = {"hits": 0, "coalesced": 0, "misses": 0}
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                  cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        if self.ttl > 0:
+            hit = self.results.get(key)
+            if hit is not None:
+                self._stats["hits"] += 1
+                return hit[0]
+        fut = self._inflight.get(key)
+        if fut is None or fut.get_loop() is not asyncio.get_running_loop():
+            self._stats["misses"] += 1
+            fut = asyncio.ensure_future(fn())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._finished(key, f, cacheable))
+        else:
+            self._stats["coalesced"] += 1
+        return await asyncio.shield(fut)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """The stored result for ``key``, without starting or joining a computation."""
+        if self.ttl <= 0:
+            return None
+        hit = self.results.get(key)
+        if hit is None:
+            return None
+        self._stats["hits"] += 1
+        return hit[0]
+
+    def put(self, key: Hashable, value: Any):
+        """Store a result computed outside ``run`` (e.g. by a streaming request)."""
+        if self.ttl > 0:
+            self.results.set(key, value, self.ttl)
+
+    def _finished(self, key: Hashable, fut: asyncio.Future, cacheable: Optional[Callable[[Any], bool]]):
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+        if fut.cancelled() or fut.exception() is not None or self.ttl <= 0:
+            return
+        if cacheable is None or cacheable(fut.result()):
+            self.results.set(key, fut.result(), self.ttl)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats, inflight=len(self._inflight))
+
+
+class SemanticCache:
+    """LRU/TTL cache of values looked up by embedding similarity.
+
+    Entries are grouped by ``scope`` (everything besides the text that must
+    match exactly). ``get`` returns the value of the most similar live entry
+    in the scope if its cosine similarity reaches ``threshold``; vectors are
+    expected to be L2-normalized.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0, threshold: float = 0.9):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        # id -> (scope, vector, value, expires)
+        self._entries: "OrderedDict[int, Tuple[str, np.ndarray, Any, float]]" = OrderedDict()
+        # scope -> (entry ids, stacked vectors), rebuilt lazily after the scope changes
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _matrix(self, scope: str) -> Tuple[List[int], np.ndarray]:
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids = [i for i, entry in self._entries.items() if entry[0] == scope]
+            vectors = np.stack([self._entries[i][1] for i in ids]) if ids else np.zeros((0, 0), dtype=np.float32)
+            cached = self._matrices[scope] = (ids, vectors)
+        return cached
+
+    def _drop(self, entry_id: int):
+        scope = self._entries.pop(entry_id)[0]
+        self._matrices.pop(scope, None)
+
+    def get(self, scope: str, vector: np.ndarray) -> Optional[Tuple[Any, float]]:
+        now = time.monotonic()
+        with self._lock:
+            ids, vectors = self._matrix(scope)
+            if ids:
+                sims = vectors @ vector
+                for pos in np.argsort(-sims):
+                    if sims[pos] < self.threshold:
+                        break
+                    entry_id = ids[pos]
+                    entry = self._entries[entry_id]
+                    if entry[3] <= now:
+                        continue
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry[2], float(sims[pos])
+            self.misses += 1
+            return None
+
+    def put(self, scope: str, vector: np.ndarray, value: Any):
+        now = time.monotonic()
+        with self._lock:
+            expired = [i for i, entry in self._entries.items() if entry[3] <= now]
+            for entry_id in expired:
+                self._drop(entry_id)
+            self._entries[self._next_id] = (scope, np.array(vector, dtype=np.float32, copy=True), value,
+                                            now + self.ttl)
+            self._next_id += 1
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+class EmbeddingCache:
+    """Memory-bounded LRU of text embeddings, keyed by a hash of (model name, text)."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_name: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{model_name}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        out = []
+        with self._lock:
+            for t in texts:
+                k = self.key(model_name, t)
+                vec = self._data.get(k)
+                if vec is None:
+                    self.misses += 1
+                else:
+                    self._data.move_to_end(k)
+                    self.hits += 1
+                out.append(vec)
+        return out
+
+    def put_many(self, model_name: str, texts: List[str], vectors: np.ndarray):
+        with self._lock:
+            for t, vec in zip(texts, vectors):
+                k = self.key(model_name, t)
+                old = self._data.pop(k, None)
+                if old is not None:
+                    self.nbytes -= old.nbytes
+                vec = np.array(vec, dtype=np.float32, copy=True)
+                self._data[k] = vec
+                self.nbytes += vec.nbytes
+            while self.nbytes > self.max_bytes and self._data:
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._data), "bytes": self.nbytes,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+result_cache = ResultCache(
+    maxsize=int(os.getenv("DEVREF_RESULT_CACHE_SIZE", "2048")),
+    default_ttl=float(os.getenv("DEVREF_RESULT_CACHE_TTL", "86400")),
+    ttls={
+        "google": float(os.getenv("DEVREF_RESULT_CACHE_TTL_GOOGLE", os.getenv("DEVREF_RESULT_CACHE_TTL", "86400"))),
+        "youtube": float(os.getenv("DEVREF_RESULT_CACHE_TTL_YOUTUBE", os.getenv("DEVREF_RESULT_CACHE_TTL", "86400"))),
+    },
+    db_path=os.getenv("DEVREF_RESULT_CACHE_DB") or None,
+    stale_while_revalidate=float(os.getenv("DEVREF_RESULT_CACHE_SWR", "0")),
+    db_retain=float(os.getenv("DEVREF_RESULT_CACHE_DB_RETAIN", "86400")),
+)
+
+# Whole /process-comment responses, for identical comments arriving together.
+response_cache = SingleFlight(maxsize=int(os.getenv("DEVREF_RESPONSE_CACHE_SIZE", "512")),
+                              ttl=float(os.getenv("DEVREF_RESPONSE_CACHE_TTL", "30")))
+
+# Responses for comments that mean the same thing as a recent one.
+semantic_cache = SemanticCache(maxsize=int(os.getenv("DEVREF_SEMANTIC_CACHE_SIZE", "1024")),
+                               ttl=float(os.getenv("DEVREF_SEMANTIC_CACHE_TTL", "600")),
+                               threshold=float(os.getenv("DEVREF_SEMANTIC_CACHE_THRESHOLD", "0.9")))
+
+embedding_cache = EmbeddingCache(max_bytes=int(float(os.getenv("DEVREF_EMBED_CACHE_MB", "64")) * 1024 * 1024))
+
+RESULT_CACHE_REQUESTS = metrics.counter("devref_result_cache_requests_total",
+                                        "Provider result cache lookups by outcome (hits, misses, stale, fallback).")
+RESPONSE_CACHE_REQUESTS = metrics.counter("devref_response_cache_requests_total",
+                                          "Recommender requests by outcome (hits, coalesced, misses).")
+SEMANTIC_CACHE_REQUESTS = metrics.counter("devref_semantic_cache_requests_total",
+                                          "Semantic response cache lookups by outcome (hits, misses).")
+SEMANTIC_CACHE_HIT_RATE = metrics.gauge("devref_semantic_cache_hit_rate",
+                                        "Semantic response cache hit rate since start.")
+SEMANTIC_CACHE_ENTRIES = metrics.gauge("devref_semantic_cache_entries", "Responses held by the semantic cache.")
+EMBED_CACHE_REQUESTS = metrics.counter("devref_embedding_cache_requests_total",
+                                       "Embedding cache lookups by outcome (hits, misses).")
+EMBED_CACHE_BYTES = metrics.gauge("devref_embedding_cache_bytes", "Memory held by cached embeddings.")
+EMBED_CACHE_HIT_RATE = metrics.gauge("devref_embedding_cache_hit_rate", "Embedding cache hit rate since start.")
+
+
+def _collect():
+    for provider, counters in result_cache.stats().items():
+        for outcome, value in counters.items():
+            RESULT_CACHE_REQUESTS.set(value, provider=provider, outcome=outcome)
+    for outcome, value in response_cache.stats().items():
+        if outcome != "inflight":
+            RESPONSE_CACHE_REQUESTS.set(value, outcome=outcome)
+    stats = semantic_cache.stats()
+    SEMANTIC_CACHE_REQUESTS.set(stats["hits"], outcome="hits")
+    SEMANTIC_CACHE_REQUESTS.set(stats["misses"], outcome="misses")
+    SEMANTIC_CACHE_HIT_RATE.set(stats["hit_rate"])
+    SEMANTIC_CACHE_ENTRIES.set(stats["entries"])
+    stats = embedding_cache.stats()
+    EMBED_CACHE_REQUESTS.set(stats["hits"], outcome="hits")
+    EMBED_CACHE_REQUESTS.set(stats["misses"], outcome="misses")
+    EMBED_CACHE_BYTES.set(stats["bytes"])
+    EMBED_CACHE_HIT_RATE.set(stats["hit_rate"])
+
+
+metrics.add_collector(_collect)
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from .metrics import PROVIDER_SECONDS, record_timing
+from .search import SearchResult
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies per provider, used to pick hedge delays."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def p95(self, name: str) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(name) or ())
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+latencies = LatencyTracker()
+
+
+def _record(name: str, start: float):
+    elapsed = time.perf_counter() - start
+    latencies.record(name, elapsed)
+    PROVIDER_SECONDS.observe(elapsed, provider=name)
+    record_timing(f"provider.{name}", elapsed)
+
+
+async def timed_search(prov, query: str, k: int) -> List[SearchResult]:
+    """Search and record the call's latency; calls cancelled by a hedge or the deadline are not recorded."""
+    name = getattr(prov, "name", str(prov))
+    start = time.perf_counter()
+    try:
+        results = await prov.asearch(query, k=k)
+    except Exception:
+        _record(name, start)
+        raise
+    _record(name, start)
+    return results
+
+
+async def hedged_search(prov, query: str, k: int, fallback_delay: float) -> List[SearchResult]:
+    """Send a second attempt if the first is still running after the provider's p95.
+
+    The first attempt to succeed wins and the other is cancelled; an error is
+    only raised once both have failed. Until enough samples exist to estimate
+    p95, ``fallback_delay`` is used.
+    """
+    delay = latencies.p95(getattr(prov, "name", str(prov)))
+    if delay is None:
+        delay = fallback_delay
+    attempts = [asyncio.ensure_future(timed_search(prov, query, k))]
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if done:
+            return attempts[0].result()
+        attempts.append(asyncio.ensure_future(timed_search(prov, query, k)))
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        # Every attempt failed; report the first one's error.
+        return attempts[0].result()
+    finally:
+        # Also runs when this search is cancelled at the deadline; unfinished attempts would keep spending quota.
+        for task in attempts:
+            if not task.done():
+                task.cancel()
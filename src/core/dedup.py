@@ -0,0 +1,85 @@
+import hashlib
+import os
+import re
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+from .search import SearchResult
+
+# Estimated word-set Jaccard similarity above which two candidates count as the same article.
+NEAR_DUP_THRESHOLD = float(os.getenv("DEVREF_NEAR_DUP_THRESHOLD", "0.7"))
+# Shorter title+snippet texts are too generic to fingerprint ("Kotlin Flow" on two different sites).
+MIN_TOKENS = 5
+NUM_PERM = 64
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_HOST_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+_TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "igshid", "ref", "ref_src",
+                    "source", "si", "feature", "spm", "_hsenc", "_hsmi", "trk", "cmpid"}
+# Universal hash family a*x + b mod p standing in for NUM_PERM random permutations of 32-bit token hashes.
+_PRIME = np.uint64((1 << 32) - 5)
+_rng = np.random.default_rng(0x5EED)
+_PERM_A = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 31, NUM_PERM, dtype=np.uint64)
+
+
+def canonical_url(url: str) -> str:
+    """Normalize a URL so mirrors and tracking variants of one page compare equal.
+
+    Scheme, ``www.``/``m.`` host prefixes, ports, fragments, trailing slashes
+    and tracking query parameters are dropped; the remaining parameters are
+    sorted. ``youtu.be/<id>`` becomes ``youtube.com/watch?v=<id>``.
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix) and host.count(".") > 1:
+            host = host[len(prefix):]
+            break
+    path = parts.path.rstrip("/")
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS]
+    if host == "youtu.be" and path:
+        host, query, path = "youtube.com", [("v", path.lstrip("/"))] + query, "/watch"
+    if host == "youtube.com" and path == "/watch":
+        query = [(k, v) for k, v in query if k == "v"]
+    return urlunsplit(("", host, path, urlencode(sorted(query)), ""))
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of the text's word set, or None when the text is too short to fingerprint."""
+    tokens = set(_TOKEN_RE.findall(text.lower()))
+    if len(tokens) < MIN_TOKENS:
+        return None
+    x = np.array([int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=4).digest(), "little")
+                  for t in tokens], dtype=np.uint64)
+    return ((x[:, None] * _PERM_A + _PERM_B) % _PRIME).min(axis=0)
+
+
+def dedupe(candidates: List[SearchResult], threshold: float = NEAR_DUP_THRESHOLD) -> List[SearchResult]:
+    """Drop candidates that point at the same page or repeat an earlier title/snippet, keeping the first."""
+    seen_urls = set()
+    kept: List[SearchResult] = []
+    signatures = np.empty((len(candidates), NUM_PERM), dtype=np.uint64)
+    nsig = 0
+    for c in candidates:
+        if not c.url:
+            continue
+        url = canonical_url(c.url)
+        if url in seen_urls:
+            continue
+        sig = minhash(f"{c.title} {c.snippet}")
+        if sig is not None:
+            # The share of equal MinHash slots estimates the Jaccard similarity of the word sets.
+            if nsig and (signatures[:nsig] == sig).mean(axis=1).max() >= threshold:
+                continue
+            signatures[nsig] = sig
+            nsig += 1
+        seen_urls.add(url)
+        kept.append(c)
+    return kept
@@ -0,0 +1,203 @@
+import glob
+import hashlib
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .ann import get_ann_index
+from .provider import DEFAULT_DATASET, InternalProvider
+from .search import SearchResult
+
+
+def candidate_text(title: str, snippet: str) -> str:
+    return f"{title}. {snippet}" if snippet else title
+
+
+def dataset_digest(dataset_path: str, model_id: str) -> str:
+    h = hashlib.sha256()
+    with open(dataset_path, "rb") as f:
+        h.update(f.read())
+    h.update(b"\0" + model_id.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _model_tag(model_id: str) -> str:
+    return hashlib.sha256(model_id.encode("utf-8")).hexdigest()[:8]
+
+
+def index_path(dataset_path: str, digest: str, model_id: str) -> str:
+    """One file per model, so backends sharing a dataset (torch and onnx) never evict each other's index."""
+    base, _ = os.path.splitext(dataset_path)
+    return f"{base}.{_model_tag(model_id)}.{digest[:16]}.npy"
+
+
+def corpus_entries(provider: InternalProvider) -> Tuple[List[str], List[SearchResult]]:
+    """Unique candidate texts of the dataset and their results, in a stable (row) order."""
+    seen = set()
+    texts = []
+    results = []
+    for topic_results in provider._topic_results.values():
+        for r in topic_results:
+            t = candidate_text(r.title, r.snippet)
+            if t not in seen:
+                seen.add(t)
+                texts.append(t)
+                results.append(r)
+    return texts, results
+
+
+class CorpusEmbeddings:
+    """Normalized embeddings of every internal entry, addressable by candidate text."""
+
+    def __init__(self, texts: Sequence[str], vectors: np.ndarray, digest: str = "",
+                 results: Optional[Sequence[SearchResult]] = None):
+        self.results = list(results or [])
+        self.rows: Dict[str, int] = {t: i for i, t in enumerate(texts)}
+        self.vectors = vectors
+        self.digest = digest
+        self.stat: Optional[Tuple[int, int]] = None
+        # After an incremental build: the digest of the corpus it was built from, and the row each
+        # entry had there (-1 for new entries), so indexes over that corpus can be updated, not rebuilt.
+        self.base_digest = ""
+        self.base_rows: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, texts: Sequence[str]) -> Tuple[List[int], List[int]]:
+        """Return (row per text or -1, positions of texts that are not indexed)."""
+        rows = [self.rows.get(t, -1) for t in texts]
+        return rows, [i for i, r in enumerate(rows) if r < 0]
+
+
+def build(dataset_path: str, reranker, provider: Optional[InternalProvider] = None,
+          previous: Optional[CorpusEmbeddings] = None) -> CorpusEmbeddings:
+    """Encode the dataset and persist it next to the YAML, unless an index for its hash exists.
+
+    With ``previous`` (the index of an earlier version of the dataset), only
+    entries whose text is new are encoded; the rest are copied over.
+    """
+    provider = provider or InternalProvider.from_yaml(dataset_path)
+    texts, results = corpus_entries(provider)
+    digest = dataset_digest(dataset_path, reranker.model_id)
+    path = index_path(dataset_path, digest, reranker.model_id)
+    rows = None
+    if previous is not None and len(previous) and texts:
+        rows, missing = previous.lookup(texts)
+    if not os.path.exists(path):
+        if not texts:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        elif rows is not None:
+            vectors = np.empty((len(texts), previous.vectors.shape[1]), dtype=np.float32)
+            kept = [i for i, r in enumerate(rows) if r >= 0]
+            if kept:
+                vectors[kept] = previous.vectors[[rows[i] for i in kept]]
+            if missing:
+                vectors[missing] = reranker.encode([texts[i] for i in missing])
+        else:
+            vectors = reranker.encode(texts)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+        os.replace(tmp, path)
+        base, _ = os.path.splitext(dataset_path)
+        # Earlier versions of this model's index, and files from before the name carried the model.
+        for stale in glob.glob(f"{base}.{_model_tag(reranker.model_id)}.*.npy") + \
+                glob.glob(f"{base}.{'[0-9a-f]' * 16}.npy"):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+    corpus = CorpusEmbeddings(texts, np.load(path, mmap_mode="r"), digest, results)
+    if rows is not None:
+        corpus.base_digest = previous.digest
+        corpus.base_rows = np.array(rows, dtype=np.int64)
+    return corpus
+
+
+_corpora: Dict[Tuple[str, str], CorpusEmbeddings] = {}
+_lock = threading.Lock()
+_refreshing = set()
+# Dataset version whose refresh failed; not retried until the file changes again.
+_failed: Dict[Tuple[str, str], Tuple[int, int]] = {}
+
+
+def _stat(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def get_corpus_embeddings(reranker, dataset_path: str = DEFAULT_DATASET, provider: Optional[InternalProvider] = None,
+                          build: bool = True) -> Optional[CorpusEmbeddings]:
+    """Process-wide corpus embeddings; updated when the dataset's content hash changes.
+
+    The file is only re-hashed when its mtime or size moves, so the per-request
+    cost is a single stat(). Only the first build blocks. After an edit the
+    current corpus keeps being served while a background thread encodes the
+    new or edited entries and prepares the ANN index; the new corpus replaces
+    the old one only once both are complete. Request paths pass
+    ``build=False`` and get None until startup has built the first corpus.
+    """
+    dataset_path = os.path.abspath(dataset_path)
+    key = (dataset_path, reranker.model_id)
+    stat = _stat(dataset_path)
+    corpus = _corpora.get(key)
+    if corpus is not None and corpus.stat == stat:
+        return corpus
+    if corpus is not None:
+        with _lock:
+            if key not in _refreshing and _failed.get(key) != stat:
+                _refreshing.add(key)
+                threading.Thread(target=_refresh, args=(key, reranker, provider, stat), daemon=True,
+                                 name="devref-corpus-refresh").start()
+        return corpus
+    if not build:
+        return None
+    with _lock:
+        corpus = _corpora.get(key)
+        if corpus is None:
+            corpus = _update(key, reranker, provider, stat)
+    return corpus
+
+
+def _update(key: Tuple[str, str], reranker, provider: Optional[InternalProvider],
+            stat: Tuple[int, int]) -> CorpusEmbeddings:
+    dataset_path = key[0]
+    corpus = _corpora.get(key)
+    digest = dataset_digest(dataset_path, reranker.model_id)
+    if corpus is not None and corpus.digest == digest:
+        corpus.stat = stat
+        return corpus
+    # Only trust a provider parsed from this exact version of the file.
+    if provider is not None and provider.source_stat not in (None, stat):
+        provider = None
+    fresh = build(dataset_path, reranker, provider, previous=corpus)
+    fresh.stat = stat
+    if corpus is not None:
+        # Requests must never train the index; have it ready before the corpus is swapped in.
+        get_ann_index(fresh)
+    _corpora[key] = fresh
+    return fresh
+
+
+def _refresh(key: Tuple[str, str], reranker, provider: Optional[InternalProvider], stat: Tuple[int, int]):
+    try:
+        _update(key, reranker, provider, stat)
+    except Exception:
+        _failed[key] = stat  # e.g. a half-written file; keep serving the last good corpus
+    finally:
+        with _lock:
+            _refreshing.discard(key)
+
+
+if __name__ == "__main__":
+    from .registry import registry
+
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATASET
+    reranker = registry.get_reranker()
+    corpus = build(os.path.abspath(path), reranker)
+    print(f"indexed {len(corpus)} entries -> {index_path(os.path.abspath(path), corpus.digest, reranker.model_id)}")
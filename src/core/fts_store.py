@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import yaml
+
+from .provider import BaseProvider, _tokens
+from .search import SearchResult
+
+DEFAULT_DB = os.getenv("DEVREF_INTERNAL_DB") or os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "data", "internal.db"))
+# Page cache per connection, in KiB; bounds what each worker keeps of the index in memory.
+CACHE_KIB = int(os.getenv("DEVREF_INTERNAL_DB_CACHE_KIB", "8192"))
+# Column weights for bm25(): topic, title, snippet, body.
+RANK_WEIGHTS = (4.0, 3.0, 1.5, 1.0)
+# Too common to narrow a full-text query; their posting lists would cover most of a large corpus.
+_STOPWORDS = frozenset("a an and are as at be by for from how i in is it of on or that the this to use we with you "
+                       "your should could would can please".split())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    topic TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL,
+    url TEXT NOT NULL,
+    snippet TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT '',
+    digest TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    topic, title, snippet, body, content='docs', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts(rowid, topic, title, snippet, body)
+    VALUES (new.id, new.topic, new.title, new.snippet, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, topic, title, snippet, body)
+    VALUES ('delete', old.id, old.topic, old.title, old.snippet, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, topic, title, snippet, body)
+    VALUES ('delete', old.id, old.topic, old.title, old.snippet, old.body);
+    INSERT INTO docs_fts(rowid, topic, title, snippet, body)
+    VALUES (new.id, new.topic, new.title, new.snippet, new.body);
+END;
+"""
+
+
+def iter_entries(path: str) -> Iterator[Dict[str, str]]:
+    """Entries of a YAML dataset (topic -> list of entries) or a JSONL export (one entry per line)."""
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    for topic, items in data.items():
+        for item in items or []:
+            if isinstance(item, dict):
+                yield dict(item, topic=str(topic))
+
+
+def _row(entry: Dict[str, str]) -> Optional[Tuple[str, ...]]:
+    url = str(entry.get("url") or "")
+    title = str(entry.get("title") or "")
+    if not url or not title:
+        return None
+    topic = str(entry.get("topic") or "")
+    snippet = str(entry.get("snippet") or "")
+    body = str(entry.get("body") or "")
+    # Entries are identified by an explicit id, else by topic and URL (one page can sit under several topics).
+    key = str(entry.get("id") or f"{topic}\0{url}")
+    digest = hashlib.sha1("\0".join((topic, title, url, snippet, body)).encode("utf-8")).hexdigest()
+    return key, topic, title, url, snippet, body, digest
+
+
+class FTSStore:
+    """Internal knowledge base in an SQLite FTS5 index on disk.
+
+    Nothing is loaded up front: every search is a ranked full-text query, and
+    each thread keeps its own read connection with a bounded page cache.
+    Ingestion upserts by entry key and skips entries whose content is unchanged.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_KIB}")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Connections must not cross a fork; reopen in the child.
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def upsert(self, entries: Iterable[Dict[str, str]], prune: bool = False,
+               batch_size: int = 1000) -> Dict[str, int]:
+        """Insert new entries and update changed ones; with prune, delete entries not in ``entries``."""
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0, "skipped": 0}
+        conn = self.conn
+        seen = set()
+        batch: List[Tuple[str, ...]] = []
+
+        def flush():
+            conn.execute("BEGIN")
+            try:
+                for row in batch:
+                    existing = conn.execute("SELECT digest FROM docs WHERE key = ?", (row[0],)).fetchone()
+                    if existing is None:
+                        conn.execute("INSERT INTO docs (key, topic, title, url, snippet, body, digest) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+                        counts["inserted"] += 1
+                    elif existing[0] != row[-1]:
+                        conn.execute("UPDATE docs SET topic = ?, title = ?, url = ?, snippet = ?, body = ?, "
+                                     "digest = ? WHERE key = ?", row[1:] + (row[0],))
+                        counts["updated"] += 1
+                    else:
+                        counts["unchanged"] += 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            batch.clear()
+
+        for entry in entries:
+            row = _row(entry)
+            if row is None:
+                counts["skipped"] += 1
+                continue
+            if prune:
+                seen.add(row[0])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        if prune:
+            stale = [key for (key,) in conn.execute("SELECT key FROM docs") if key not in seen]
+            conn.execute("BEGIN")
+            conn.executemany("DELETE FROM docs WHERE key = ?", [(key,) for key in stale])
+            conn.execute("COMMIT")
+            counts["deleted"] = len(stale)
+        return counts
+
+    def search(self, query: str, k: int = 10) -> List[SearchResult]:
+        terms = [t for t in dict.fromkeys(_tokens(query)) if t not in _STOPWORDS]
+        if not terms:
+            return []
+        # Any query term may match; bm25() ranks documents matching more (and rarer) terms first.
+        match = " OR ".join(f'"{t}"' for t in terms)
+        weights = ", ".join(str(w) for w in RANK_WEIGHTS)
+        rows = self.conn.execute(
+            f"SELECT d.title, d.url, d.snippet FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid "
+            f"WHERE docs_fts MATCH ? ORDER BY bm25(docs_fts, {weights}) LIMIT ?",
+            (match, k * 2)).fetchall()
+        results, seen = [], set()
+        for title, url, snippet in rows:
+            if url in seen:
+                continue
+            seen.add(url)
+            results.append(SearchResult(title=title, url=url, snippet=snippet, source="internal"))
+        return results[:k]
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+
+class FTSInternalProvider(BaseProvider):
+    """Internal source backed by an FTSStore instead of the in-memory YAML index."""
+
+    name = "internal"
+
+    def __init__(self, store: FTSStore):
+        self.store = store
+
+    def search(self, query: str, k: int = 10) -> List[SearchResult]:
+        return self.store.search(query, k)
+
+
+_providers: Dict[str, FTSInternalProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def load_fts_provider(path: str = DEFAULT_DB) -> FTSInternalProvider:
+    path = os.path.abspath(path)
+    provider = _providers.get(path)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(path)
+            if provider is None:
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"internal store {path} does not exist; run python -m core.fts_store "
+                                            f"ingest <dataset> first")
+                provider = _providers[path] = FTSInternalProvider(FTSStore(path))
+    return provider
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "ingest"
+    if command == "ingest":
+        args = [a for a in sys.argv[2:] if a != "--prune"]
+        source = args[0] if args else os.path.join(os.path.dirname(DEFAULT_DB), "internal_dataset.yaml")
+        db = args[1] if len(args) > 1 else DEFAULT_DB
+        store = FTSStore(db)
+        counts = store.upsert(iter_entries(source), prune="--prune" in sys.argv)
+        print(f"{db}: {', '.join(f'{v} {k}' for k, v in counts.items())}; {len(store)} entries")
+    elif command == "search":
+        query = sys.argv[2] if len(sys.argv) > 2 else ""
+        for r in FTSStore(sys.argv[3] if len(sys.argv) > 3 else DEFAULT_DB).search(query, 10):
+            print(f"{r.title}\n    {r.url}")
+    else:
+        sys.exit(f"unknown command {command}; expected ingest or search")
@@ -0,0 +1,94 @@
+from collections import deque
+from typing import Dict, Hashable, Iterator, List, Tuple
+
+
+_SUFFIXES = ("s", "es", "ed", "ing")
+# Shorter patterns only match exactly: "di" + "ed" would find "died".
+MIN_INFLECTED_LENGTH = 3
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _inflection_end(text: str, end: int, last: str) -> int:
+    """End of a plural/verb suffix ("s", "es", "ed", "ing", "prefer-red") starting at ``end``, or -1."""
+    for suffix in _SUFFIXES + (last + "ed", last + "ing"):
+        stop = end + len(suffix)
+        if text.startswith(suffix, end) and (stop == len(text) or not _is_word_char(text[stop])):
+            return stop
+    return -1
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: all patterns are found in one linear pass over the text.
+
+    Patterns are matched on word boundaries, so "di" does not match inside
+    "did" and "vm" does not match inside "mvvm". Patterns of at least
+    ``MIN_INFLECTED_LENGTH`` letters ending in a letter also match with a
+    short suffix: "viewmodels", "injecting", "preferred".
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Hashable]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value: Hashable):
+        pattern = pattern.lower()
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), value))
+        self._built = False
+
+    def build(self) -> "AhoCorasick":
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Hashable]]:
+        """Yield (start, end, value) for every whole-word or inflected occurrence in lowercase ``text``."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        n = len(text)
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            end = word_end = i + 1
+            if end < n and _is_word_char(text[end]):
+                if not ch.isalpha():
+                    continue
+                word_end = _inflection_end(text, end, ch)
+                if word_end < 0:
+                    continue
+            for length, value in out[node]:
+                if word_end != end and length < MIN_INFLECTED_LENGTH:
+                    continue
+                start = end - length
+                if start == 0 or not _is_word_char(text[start - 1]):
+                    yield start, word_end, value
@@ -1,6 +1,9 @@
 import itertools
 import re
-from typing import Dict, List
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from .matcher import AhoCorasick
 
 
 def normalize(text: str) -> str:
@@ -9,67 +12,97 @@ def normalize(text: str) -> str:
     return re.sub(r"\s+", " ", text.strip().lower())
 
 
-def extract_topics(comment: str) -> Dict[str, List[str]]:
-    text = normalize(comment)
-    topics = []
-    keywords = []
-    intents = []
-
-    for key, syns in SYNONYMS.items():
-        if key in text or any(s in text for s in syns):
-            topics.append(key)
-
-    for hint in STACK_HINTS:
-        if hint in text:
-            keywords.append(hint)
-
-    if any(w in text for w in ["prefer", "instead", "should use"]):
-        intents.append("replace-tech")
-    if any(w in text for w in ["avoid", "anti-pattern", "don't", "do not"]):
-        intents.append("avoid-pattern")
-    if any(w in text for w in ["inject", "di", "dependency injection"]):
-        intents.append("apply-di")
-
-    if not topics and "repository" in text:
-        topics.append("repository pattern")
+INTENT_KEYWORDS = {
+    "replace-tech": ["prefer", "instead", "should use"],
+    "avoid-pattern": ["avoid", "anti-pattern", "don't", "do not"],
+    "apply-di": ["inject", "di", "dependency injection"],
+}
 
-    return {"topics": sorted(set(topics)), "keywords": sorted(set(keywords)), "intents": sorted(set(intents))}
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def _vocabulary_matcher() -> AhoCorasick:
+    """Compile SYNONYMS, STACK_HINTS and INTENT_KEYWORDS into one automaton, once."""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                m = AhoCorasick()
+                for key, syns in SYNONYMS.items():
+                    for s in [key] + list(syns):
+                        m.add(s, ("topic", key))
+                for hint in STACK_HINTS:
+                    m.add(hint, ("keyword", hint))
+                for intent, words in INTENT_KEYWORDS.items():
+                    for w in words:
+                        m.add(w, ("intent", intent))
+                _matcher = m.build()
+    return _matcher
 
 
-def build_queries(extraction: Dict[str, List[str]]) -> List[str]:
-    raw_topics = extraction.get("topics") or []
-    intents = [i.lower() for i in (extraction.get("intents") or [])]
+def extract_topics(comment: str) -> Dict[str, List[str]]:
+    text = normalize(comment)
+    found = {"topic": set(), "keyword": set(), "intent": set()}
 
-    # Normalize and keep order — lowercase, strip, unique
-    seen = set()
-    topics = []
-    for t in raw_topics:
-        if not t:
-            continue
-        tt = t.strip()
-        if not tt:
-            continue
-        tl = tt if isinstance(tt, str) else str(tt)
-        tl = tl.strip()
-        key = tl.lower()
-        if key not in seen:
-            seen.add(key)
-            topics.append(tl)
+    for _, _, (kind, value) in _vocabulary_matcher().iter_matches(text):
+        found[kind].add(value)
 
-    if not topics:
-        return []
-
-    queries = []
+    topics = found["topic"]
+    if not topics and "repository" in text:
+        topics.add("repository pattern")
+
+    return {"topics": sorted(topics), "keywords": sorted(found["keyword"]), "intents": sorted(found["intent"])}
+
+
+# Explicit direction in a comment: which technology is being moved away from ("from")
+# and which one is wanted ("to"). A clause ends at punctuation or at the next cue.
+_CLAUSE = r"[^,.;!?]+?"
+_CLAUSE_END = r"(?=[,.;!?]|$|\s+(?:not|instead|rather|over|with|for|to)\b)"
+_ROLE_PATTERNS = [
+    re.compile(rf"\b(?:replace|swap|substitute)\s+(?P<src>{_CLAUSE})\s+(?:with|for|by)\s+"
+               rf"(?P<dst>{_CLAUSE}){_CLAUSE_END}"),
+    re.compile(rf"\b(?:migrate|migrating|switch|switching|move|moving)\s+(?:from\s+)?(?P<src>{_CLAUSE})\s+to\s+"
+               rf"(?P<dst>{_CLAUSE}){_CLAUSE_END}"),
+    re.compile(rf"(?P<dst>{_CLAUSE})\s+(?:instead of|rather than)\s+(?P<src>{_CLAUSE}){_CLAUSE_END}"),
+    re.compile(rf"\b(?:not|don't|never|avoid|drop|remove|without)\s+(?P<src>{_CLAUSE}){_CLAUSE_END}"),
+    re.compile(rf"(?<!not )(?<!n't )(?<!never )\b(?:use|prefer|adopt|switch to)\s+(?P<dst>{_CLAUSE}){_CLAUSE_END}"),
+]
 
-    # helpers
-    def add(q):
-        q = q.strip()
-        if q and q.lower() not in (x.lower() for x in queries):
-            queries.append(q)
 
-    def combos_of_two(items):
-        return list(itertools.combinations(items, 2))
+def topic_roles(comment: str) -> List[str]:
+    """Sorted topic and intent keys, with the direction of a change where the comment states one.
 
+    A topic is ``from:x`` or ``to:x`` when an explicit cue ("replace X with Y",
+    "Y instead of X", "not X", "use Y") gives it that role, and ``topic:x``
+    otherwise or when the cues disagree; intents are ``intent:y``. Wording and
+    mention order do not matter, so "swap Dagger for Hilt" and "please use
+    hilt, not dagger" get the same keys and "replace Hilt with Dagger" does not.
+    """
+    text = normalize(comment)
+    spans = {"src": [], "dst": []}
+    for pattern in _ROLE_PATTERNS:
+        for m in pattern.finditer(text):
+            for group, value in m.groupdict().items():
+                if value is not None:
+                    spans[group].append(m.span(group))
+
+    roles: Dict[str, set] = {}
+    intents = set()
+    for start, _, (kind, value) in _vocabulary_matcher().iter_matches(text):
+        if kind == "intent":
+            intents.add(f"intent:{value}")
+        elif kind == "topic":
+            found = roles.setdefault(value, set())
+            for group, role in (("src", "from"), ("dst", "to")):
+                if any(a <= start < b for a, b in spans[group]):
+                    found.add(role)
+    keys = {f"{next(iter(r)) if len(r) == 1 else 'topic'}:{topic}" for topic, r in roles.items()}
+    return sorted(keys | intents)
+
+
+def _query_templates(topics: List[str], intents: List[str]) -> Iterator[Optional[str]]:
+    """Candidate queries in priority order; nothing is built until it is consumed."""
     # Make a compact joined stack string like "Compose Android Kotlin"
     stack_join = " ".join(
         [t for t in topics if t.lower() not in ("android",)]).strip()  # keep Android out of stack_join if present
@@ -78,79 +111,103 @@ def build_queries(extraction: Dict[str, List[str]]) -> List[str]:
     # Intent-aware templates
     if "replace-tech" in intents or "migrate" in intents or "migration" in intents:
         # If we have at least two topics, produce migrate/replace queries for pairwise combinations
-        pairs = combos_of_two(topics)
-        for a, b in pairs:
-            add(f"migrate from {a} to {b} Android Kotlin")
-            add(f"migrate {a} to {b} tutorial")
-            add(f"replace {a} with {b} Android")
-            add(f"{b} migration guide (from {a})")
-            add(f"{a} vs {b} (pros and cons)")
+        for a, b in itertools.combinations(topics, 2):
+            yield f"migrate from {a} to {b} Android Kotlin"
+            yield f"migrate {a} to {b} tutorial"
+            yield f"replace {a} with {b} Android"
+            yield f"{b} migration guide (from {a})"
+            yield f"{a} vs {b} (pros and cons)"
             # YouTube-friendly
-            add(f"{a} to {b} migration tutorial youtube")
-            add(f"{b} vs {a} comparison youtube")
+            yield f"{a} to {b} migration tutorial youtube"
+            yield f"{b} vs {a} comparison youtube"
         # also general migration queries
-        add(f"{full_context} migration guide")
-        add(f"{full_context} replace tutorial")
+        yield f"{full_context} migration guide"
+        yield f"{full_context} replace tutorial"
     # Comparison / evaluation intent
     if "compare" in intents or "evaluation" in intents or "vs" in intents:
-        pairs = combos_of_two(topics)
-        for a, b in pairs:
-            add(f"{a} vs {b} Android Kotlin")
-            add(f"{a} vs {b} performance comparison")
-            add(f"{a} vs {b} tutorial")
-            add(f"{a} vs {b} youtube")
+        for a, b in itertools.combinations(topics, 2):
+            yield f"{a} vs {b} Android Kotlin"
+            yield f"{a} vs {b} performance comparison"
+            yield f"{a} vs {b} tutorial"
+            yield f"{a} vs {b} youtube"
     # Learning / tutorials intent
     if "learn" in intents or "howto" in intents or "tutorial" in intents or not intents:
         # default: for each topic, generate common helpful queries
         for t in topics:
-            add(f"{t} tutorial")
-            add(f"{t} guide")
-            add(f"{t} best practices")
-            add(f"{t} implementation example")
-            add(f"{t} android kotlin tutorial")
-            add(f"{t} youtube tutorial")
-            add(f"{t} github examples")
-            add(f"{t} official docs")
-            add(f"{t} site:developer.android.com")
-            add(f"{t} site:github.com")
+            yield f"{t} tutorial"
+            yield f"{t} guide"
+            yield f"{t} best practices"
+            yield f"{t} implementation example"
+            yield f"{t} android kotlin tutorial"
+            yield f"{t} youtube tutorial"
+            yield f"{t} github examples"
+            yield f"{t} official docs"
+            yield f"{t} site:developer.android.com"
+            yield f"{t} site:github.com"
     # Best-practices / architecture / production intent
     if "best-practices" in intents or "architecture" in intents or "production" in intents:
         for t in topics:
-            add(f"{t} best practices")
-            add(f"{t} architecture patterns")
-            add(f"{t} production ready")
-            add(f"{t} performance optimization")
+            yield f"{t} best practices"
+            yield f"{t} architecture patterns"
+            yield f"{t} production ready"
+            yield f"{t} performance optimization"
     # Examples / snippets / github
     if "example" in intents or "examples" in intents or "code" in intents:
         for t in topics:
-            add(f"{t} code example")
-            add(f"{t} sample project github")
-            add(f"{t} example implementation")
+            yield f"{t} code example"
+            yield f"{t} sample project github"
+            yield f"{t} example implementation"
     # Official docs / authoritative sources
-    add(f"{full_context} official docs")
-    add(f"{stack_join} official docs" if stack_join else None)
-    add(f"{full_context} developer.android.com")
-    add(f"{full_context} github examples")
+    yield f"{full_context} official docs"
+    yield f"{stack_join} official docs" if stack_join else None
+    yield f"{full_context} developer.android.com"
+    yield f"{full_context} github examples"
 
     # Add a couple of high-value cross queries combining main topics and typical helpful terms
-    add(f"{full_context} best practices guide")
-    add(f"{full_context} tutorial android kotlin")
-    add(f"{full_context} migration guide")
-    add(f"{full_context} comparison")
-    add(f"{full_context} youtube tutorial")
-
-    # Final cleanup & dedupe while preserving order and removing Nones
-    cleaned = []
+    yield f"{full_context} best practices guide"
+    yield f"{full_context} tutorial android kotlin"
+    yield f"{full_context} migration guide"
+    yield f"{full_context} comparison"
+    yield f"{full_context} youtube tutorial"
+
+
+def iter_queries(extraction: Dict[str, List[str]]) -> Iterator[str]:
+    """Lazily yield unique search queries for an extraction, highest priority first."""
+    raw_topics = extraction.get("topics") or []
+    intents = [i.lower() for i in (extraction.get("intents") or [])]
+
+    # Normalize and keep order — lowercase, strip, unique
+    seen = set()
+    topics = []
+    for t in raw_topics:
+        if not t:
+            continue
+        tl = str(t).strip()
+        if not tl:
+            continue
+        key = tl.lower()
+        if key not in seen:
+            seen.add(key)
+            topics.append(tl)
+
+    if not topics:
+        return
+
+    # Collapse whitespace and dedupe case-insensitively, in O(1) per query
     seen_lower = set()
-    for q in queries:
+    for q in _query_templates(topics, intents):
         if not q:
             continue
-        q_s = " ".join(q.split())  # collapse whitespace
+        q_s = " ".join(q.split())
         kl = q_s.lower()
-        if kl not in seen_lower:
+        if q_s and kl not in seen_lower:
             seen_lower.add(kl)
-            cleaned.append(q_s)
-    return cleaned
+            yield q_s
+
+
+def build_queries(extraction: Dict[str, List[str]], budget: Optional[int] = None) -> List[str]:
+    """Materialize at most ``budget`` queries (all of them when ``budget`` is None)."""
+    return list(itertools.islice(iter_queries(extraction), budget))
 
 
 SYNONYMS = {
@@ -1,21 +1,53 @@
+import asyncio
+import copy
+import json
 import os
-from typing import List, Dict, Any
+import time
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 
-from core.provider import InternalProvider, GoogleProvider, YouTubeProvider
-from .nlp import extract_topics, build_queries
-from .rerank import rerank as simple_rerank
+from core.provider import (InternalProvider, InternalVectorProvider, GoogleProvider, YouTubeProvider,
+                           load_internal_provider)
+from .aio import run_sync
+from .ann import get_ann_index
+from .cache import normalize_query, response_cache, result_cache, semantic_cache
+from .dedup import dedupe
+from .deadline import hedged_search, timed_search
+from .embed_index import get_corpus_embeddings
+from .fts_store import load_fts_provider
+from .metrics import (CANDIDATES, PROVIDER_DROPPED, PROVIDER_ERRORS, REQUEST_SECONDS, stage,
+                      start_request_timings)
+from .nlp import build_queries, extract_topics, topic_roles
+from .quota import QUOTA_FALLBACKS, APIError, QuotaExceeded, UpstreamError, priority
+from .registry import DEFAULT_BACKEND, backend_available, registry
+from .rerank import CorpusStats, corpus_stats, rerank as simple_rerank
 from .search import SearchResult
 
-try:
-    from .rerank_sbert import EmbeddingReranker
+# The backend itself (torch / onnxruntime) is only imported when the registry loads a model.
+SBERT_AVAILABLE = backend_available(DEFAULT_BACKEND)
 
-    SBERT_AVAILABLE = True
-except Exception:
-    SBERT_AVAILABLE = False
+DEFAULT_LATENCY_BUDGET_MS = int(os.getenv("DEVREF_LATENCY_BUDGET_MS", "4000"))
+DEFAULT_HEDGE_AFTER_MS = int(os.getenv("DEVREF_HEDGE_AFTER_MS", "800"))
+DEFAULT_MAX_QUERIES = int(os.getenv("DEVREF_MAX_QUERIES", "2"))
+MAX_BATCH_COMMENTS = int(os.getenv("DEVREF_MAX_BATCH_COMMENTS", "100"))
+DEFAULT_INTERNAL_SEARCH = os.getenv("DEVREF_INTERNAL_SEARCH", "topics")
+# "yaml" indexes internal_dataset.yaml in memory; "fts" queries the on-disk SQLite store (core/fts_store.py).
+DEFAULT_INTERNAL_STORE = os.getenv("DEVREF_INTERNAL_STORE", "yaml").lower()
+
+
+def _error_text(exc: BaseException) -> str:
+    """What a warning may say about a provider failure.
+
+    Only our own quota/API errors are quoted; anything else (httpx errors
+    included) is reduced to its type, since its text can contain the request
+    URL and with it the API key.
+    """
+    if isinstance(exc, (APIError, QuotaExceeded, UpstreamError)):
+        return str(exc)
+    return type(exc).__name__
 
 
 class Recommender:
-    def __init__(self, *, google_cfg: dict = None, youtube_cfg: dict = None):
+    def __init__(self, *, google_cfg: dict = None, youtube_cfg: dict = None, reranker=None):
 
         self.google_cfg = {
             "api_key": (google_cfg or {}).get("api_key") or os.getenv("GOOGLE_API_KEY"),
@@ -23,16 +55,38 @@ class Recommender:
         }
         self.youtube_cfg = {"api_key": (youtube_cfg or {}).get("api_key") or os.getenv("YOUTUBE_API_KEY")}
 
-        self.reranker = EmbeddingReranker() if SBERT_AVAILABLE else None
+        # Borrow the process-wide model; never load one per request. While it is
+        # still loading in the background, or its corpus embeddings are still being
+        # built after it loaded, rank lexically instead of waiting.
+        if reranker is None and SBERT_AVAILABLE and not registry.is_loading():
+            try:
+                reranker = registry.get_reranker()
+            except Exception:
+                reranker = None
+        self.reranker = reranker
+
+    def _internal_provider(self, mode: str, nprobe: int = None):
+        if DEFAULT_INTERNAL_STORE == "fts":
+            # Full-text ranked already; the corpus is too large to embed in every worker.
+            return load_fts_provider()
+        internal = load_internal_provider()
+        if mode == "vector" and self.reranker is not None:
+            try:
+                # Never embed the corpus or train the index inside a request; use topic lookup until startup has.
+                corpus = get_corpus_embeddings(self.reranker, provider=internal, build=False)
+                index = get_ann_index(corpus, build=False) if corpus is not None else None
+                if index is not None:
+                    return InternalVectorProvider(self.reranker, corpus, index, nprobe=nprobe)
+            except Exception:
+                pass
+        return internal
 
-    def _resolve_sources(self, names: List[str]) -> List:
+    def _resolve_sources(self, names: List[str], internal_mode: str = "topics", nprobe: int = None) -> List:
         providers = []
         for n in names:
             n_low = n.lower()
             if n_low in "internal":
-                seed_path = os.path.join(os.path.dirname(__file__), "..", "data", "internal_dataset.yaml")
-                mock_provider = InternalProvider.from_yaml(seed_path)
-                providers.append(InternalProvider(seed=mock_provider.seed))
+                providers.append(self._internal_provider(internal_mode, nprobe))
             elif n_low == "google":
                 providers.append(
                     GoogleProvider(api_key=self.google_cfg.get("api_key"), cse_id=self.google_cfg.get("cse_id")))
@@ -42,13 +96,173 @@ class Recommender:
                 continue
         return providers
 
+    def _corpus(self, providers: List):
+        for p in providers:
+            if isinstance(p, InternalVectorProvider):
+                return p.corpus
+        internal = next((p for p in providers if isinstance(p, InternalProvider)), None)
+        if internal is None:
+            return None
+        try:
+            return get_corpus_embeddings(self.reranker, provider=internal, build=False)
+        except Exception:
+            return None
+
+    def _prepare(self, opts: Dict[str, Any]) -> Tuple[List, Optional[CorpusStats]]:
+        """Providers and lexical ranking statistics for a request.
+
+        Both may stat or re-parse the dataset and count a reloaded corpus, so
+        this runs in a worker thread, never on the shared event loop.
+        """
+        providers = self._resolve_sources(opts["source_names"], opts["internal_mode"], opts["nprobe"])
+        return providers, self._lexical_stats()
+
+    @staticmethod
+    def _lexical_stats():
+        if DEFAULT_INTERNAL_STORE == "fts":
+            return None
+        try:
+            return corpus_stats(load_internal_provider())
+        except Exception:
+            return None
+
+    def _sbert_score(self, query_text: str, candidates: List[SearchResult], providers: List):
+        return self.reranker.score(query_text, candidates, self._corpus(providers))
+
+    def _sbert_score_batch(self, query_texts: List[str], candidate_lists: List[List[SearchResult]], providers: List):
+        return self.reranker.score_batch(query_texts, candidate_lists, self._corpus(providers))
+
     def process(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        comment = payload.get("comment", "") or ""
-        tags = payload.get("tags") or []
-        settings = payload.get("settings") or {}
-        top_k = int(settings.get("num_recommendations", 3))
-        source_names = settings.get("sources", ["internal"])
-        extracted_topics_dict = extract_topics(comment) or {}
+        return run_sync(self.aprocess(payload))
+
+    @staticmethod
+    def _search(prov, query: str, hedge_after_s: float = None, degraded: Optional[set] = None):
+        """Search one provider; adds its name to ``degraded`` when a fallback answered instead."""
+        def fetch():
+            if hedge_after_s is not None and not isinstance(prov, InternalProvider):
+                return hedged_search(prov, query, 10, hedge_after_s)
+            return timed_search(prov, query, 10)
+
+        if getattr(prov, "cacheable", False):
+            on_fallback = (lambda: degraded.add(prov.name)) if degraded is not None else None
+            return Recommender._quota_fallback(
+                prov, query, result_cache.get_or_fetch(prov, query, 10, fetch, on_fallback), degraded)
+        return fetch()
+
+    @staticmethod
+    async def _quota_fallback(prov, query: str, search, degraded: Optional[set] = None) -> List[SearchResult]:
+        try:
+            return await search
+        except QuotaExceeded:
+            # The API key's budget is spent and nothing is cached: the internal source stands in for this query.
+            QUOTA_FALLBACKS.inc(provider=prov.name, to="internal")
+            if degraded is not None:
+                degraded.add(prov.name)
+            internal = await asyncio.to_thread(
+                load_fts_provider if DEFAULT_INTERNAL_STORE == "fts" else load_internal_provider)
+            return await internal.asearch(query, 10)
+
+    @staticmethod
+    def _pairs(providers: List, queries: List[str], comment: str = "") -> List:
+        # Providers with ``query_mode == "comment"`` are queried once with the raw comment instead.
+        pairs = []
+        for prov in providers:
+            prov_queries = [comment] if getattr(prov, "query_mode", None) == "comment" and comment else queries
+            pairs.extend((prov, q) for q in prov_queries)
+        return pairs
+
+    async def _run_pairs(self, pairs: List, warnings: List[str], budget_s: float = None,
+                         hedge_after_s: float = None) -> Tuple[List[Optional[List[SearchResult]]], List[str], set]:
+        """Query every (provider, query) pair concurrently within ``budget_s`` seconds.
+
+        Returns one result list per pair, or None for pairs still running at the
+        deadline (those are cancelled and their providers reported as dropped).
+        Failed pairs yield an empty list and a warning. The third value holds
+        the indices of degraded pairs: failed ones and ones answered by a
+        fallback (an expired cache entry or the internal source).
+        """
+        flags = [set() for _ in pairs]
+        tasks = [asyncio.ensure_future(self._search(prov, q, hedge_after_s, flags[i]))
+                 for i, (prov, q) in enumerate(pairs)]
+        if not tasks:
+            return [], [], set()
+        with stage("providers"):
+            _, pending = await asyncio.wait(tasks, timeout=budget_s)
+        for task in pending:
+            task.cancel()
+
+        results: List[Optional[List[SearchResult]]] = []
+        failed = set()
+        dropped = []
+        degraded = {i for i, f in enumerate(flags) if f}
+        for i, ((prov, _), task) in enumerate(zip(pairs, tasks)):
+            name = getattr(prov, 'name', str(prov))
+            if task in pending:
+                PROVIDER_DROPPED.inc(provider=name)
+                if name not in dropped:
+                    dropped.append(name)
+                results.append(None)
+                continue
+            if task.exception() is not None:
+                PROVIDER_ERRORS.inc(provider=name)
+                degraded.add(i)
+                if name not in failed:
+                    failed.add(name)
+                    warnings.append(f"Provider {name} error: {_error_text(task.exception())}")
+                results.append([])
+                continue
+            results.append(task.result())
+        return results, dropped, degraded
+
+    async def _fan_out(self, providers: List, queries: List[str], warnings: List[str],
+                       budget_s: float = None, hedge_after_s: float = None, comment: str = ""):
+        """Fan out one comment's queries; results come back in provider-then-query order."""
+        pairs = self._pairs(providers, queries, comment)
+        results, dropped, degraded = await self._run_pairs(pairs, warnings, budget_s=budget_s,
+                                                           hedge_after_s=hedge_after_s)
+        raw_candidates: List[SearchResult] = []
+        for res in results:
+            if res:
+                raw_candidates.extend(res)
+        return raw_candidates, dropped, self._names(pairs, degraded)
+
+    @staticmethod
+    def _names(pairs: List, indices) -> List[str]:
+        names = []
+        for i in sorted(indices):
+            name = getattr(pairs[i][0], 'name', str(pairs[i][0]))
+            if name not in names:
+                names.append(name)
+        return names
+
+    @staticmethod
+    def _options(settings: Dict[str, Any]) -> Dict[str, Any]:
+        hedge_after_s = None
+        if settings.get("hedge_requests"):
+            hedge_after_s = float(settings.get("hedge_after_ms") or DEFAULT_HEDGE_AFTER_MS) / 1000.0
+        return {
+            "top_k": int(settings.get("num_recommendations", 3)),
+            "budget_s": float(settings.get("latency_budget_ms") or DEFAULT_LATENCY_BUDGET_MS) / 1000.0,
+            "hedge_after_s": hedge_after_s,
+            "source_names": settings.get("sources", ["internal"]),
+            "internal_mode": str(settings.get("internal_search") or DEFAULT_INTERNAL_SEARCH).lower(),
+            "nprobe": int(settings["ann_nprobe"]) if settings.get("ann_nprobe") else None,
+            # Only the queries we will actually send are generated (already deduplicated).
+            "max_queries": int(settings.get("max_queries") or DEFAULT_MAX_QUERIES),
+        }
+
+    @staticmethod
+    def _tags(tags: Any) -> List[str]:
+        if tags is None:
+            return []
+        if not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+            raise ValueError("tags must be a list of strings")
+        return tags
+
+    @staticmethod
+    def _plan(comment: str, tags: List[str], max_queries: int) -> Tuple[List[str], str, Dict[str, List[str]]]:
+        with stage("extract_topics"):
+            extracted_topics_dict = extract_topics(comment) or {}
         extracted_topics = extracted_topics_dict.get('topics', [])
 
         combined_topics = extracted_topics + tags
@@ -57,69 +271,344 @@ class Recommender:
             "topics": combined_topics,
             "intents": extracted_topics_dict.get('intents', [])
         }
-        print(processed_extraction)
-
-        queries = build_queries(processed_extraction)
-        # Deduplicate while keeping order
-        unique_queries = []
-        seen = set()
-        for q in queries:
-            qnorm = q.lower().strip()
-            if qnorm not in seen:
-                seen.add(qnorm)
-                unique_queries.append(q)
-            if len(unique_queries) == 2:
-                break
-
-        queries = unique_queries
 
+        with stage("build_queries"):
+            queries = build_queries(processed_extraction, budget=max_queries)
         query_text = " ".join(queries) if queries else comment
+        return queries, query_text, processed_extraction
+
+    @staticmethod
+    def _dedupe(raw_candidates: List[SearchResult]) -> List[SearchResult]:
+        # Mirrors, tracking-parameter variants and reposts are collapsed before they cost an encode.
+        return dedupe(raw_candidates)[:200]
+
+    @staticmethod
+    def _merge(raw_candidates: List[SearchResult]) -> List[SearchResult]:
+        with stage("dedup"):
+            merged = Recommender._dedupe(raw_candidates)
+        CANDIDATES.observe(len(raw_candidates), stage="raw")
+        CANDIDATES.observe(len(merged), stage="merged")
+        return merged
+
+    @staticmethod
+    def _recommendations(scored: List[Tuple[SearchResult, float]], top_k: int) -> List[dict]:
+        return [{
+            "title": c.title,
+            "url": c.url,
+            "snippet": c.snippet,
+            "score": float(score),
+            "source": c.source
+        } for c, score in scored[:top_k]]
+
+    @staticmethod
+    def _resources(recommendations: List) -> List[dict]:
+        resources = []
+        for r in recommendations:
+            resources.append({
+                "title": r.get("title") if isinstance(r, dict) else getattr(r, "title", ""),
+                "url": r.get("url") if isinstance(r, dict) else getattr(r, "url", ""),
+                "source": r.get("source") if isinstance(r, dict) else getattr(r, "source", "")
+            })
+        return resources
+
+    def _response_scope(self, payload: Dict[str, Any]) -> list:
+        """Everything besides the comment that decides a response."""
+        opts = self._options(payload.get("settings") or {})
+        opts["source_names"] = sorted({str(n).lower() for n in opts["source_names"]})
+        tags = sorted({normalize_query(str(t)) for t in payload.get("tags") or []})
+        # Requests without credentials get no external results, so they must not share answers with ones that have them.
+        creds = [self.google_cfg.get("cse_id"), bool(self.google_cfg.get("api_key")),
+                 bool(self.youtube_cfg.get("api_key"))]
+        return [tags, opts, creds]
+
+    def _response_key(self, payload: Dict[str, Any]) -> str:
+        return json.dumps([normalize_query(payload.get("comment", "") or "")] + self._response_scope(payload),
+                          sort_keys=True)
 
-        providers = self._resolve_sources(source_names)
+    async def _semantic_lookup(self, payload: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[tuple]]:
+        """A cached response for a comment that means the same as a recent one.
+
+        Also returns the ``(scope, vector)`` to store the fresh response under,
+        or None when the semantic cache does not apply.
+        """
+        comment = payload.get("comment", "") or ""
+        if not (self.reranker is not None and semantic_cache.ttl > 0 and comment.strip()):
+            return None, None
+        # Embeddings barely separate opposite requests ("replace Dagger with Hilt" / "... Hilt with Dagger"),
+        # so only comments naming the same topics and intents, in the same direction, can share an answer.
+        scope = json.dumps(self._response_scope(payload) + [self.reranker.model_id, topic_roles(comment)],
+                           sort_keys=True)
+        try:
+            vector = (await asyncio.to_thread(self.reranker.encode_cached, [comment]))[0]
+        except Exception:
+            return None, None
+        hit = semantic_cache.get(scope, vector)
+        return (hit[0] if hit is not None else None), (scope, vector)
+
+    async def _aprocess_response(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # A comment that means the same as a recent one gets its answer without any provider calls.
+        hit, semantic_key = await self._semantic_lookup(payload)
+        if hit is not None:
+            return hit
+        response, _ = await self._aprocess(payload)
+        if semantic_key is not None and self._complete(response):
+            semantic_cache.put(*semantic_key, response)
+        return response
+
+    async def aprocess(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        timings = start_request_timings()
+        start = time.perf_counter()
+        is_debug = bool((payload.get("settings") or {}).get("debug"))
+        if is_debug:
+            response, debug = await self._aprocess(payload)
+        else:
+            # Identical comments in flight share one pipeline run, and repeats shortly
+            # after reuse its answer. Degraded answers (dropped or failed sources) are not kept.
+            response = copy.deepcopy(await response_cache.run(
+                self._response_key(payload), lambda: self._aprocess_response(payload), cacheable=self._complete))
+        elapsed = time.perf_counter() - start
+        REQUEST_SECONDS.observe(elapsed, endpoint="process")
+        if is_debug:
+            timings["total"] = round(elapsed * 1000.0, 3)
+            debug["timings_ms"] = timings
+            response["debug"] = debug
+        return response
+
+    async def _aprocess(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        comment = payload.get("comment", "") or ""
+        tags = payload.get("tags") or []
+        opts = self._options(payload.get("settings") or {})
+        top_k = opts["top_k"]
+
+        queries, query_text, extraction = self._plan(comment, tags, opts["max_queries"])
+
+        providers, stats = await asyncio.to_thread(self._prepare, opts)
 
         warnings = []
-        raw_candidates: List[SearchResult] = []
+        raw_candidates, dropped_sources, degraded_sources = await self._fan_out(
+            providers, queries or [comment], warnings, budget_s=opts["budget_s"],
+            hedge_after_s=opts["hedge_after_s"], comment=comment)
+        merged = self._merge(raw_candidates)
+        recommendations = await self._rank(query_text, merged, providers, top_k, warnings, stats)
+        debug = {
+            "extraction": extraction,
+            "queries": queries,
+            "candidates": {"raw": len(raw_candidates), "merged": len(merged)},
+            "warnings": warnings,
+        }
+        return {"resources": self._resources(recommendations), "dropped_sources": dropped_sources,
+                "degraded_sources": degraded_sources}, debug
 
-        for prov in providers:
+    @staticmethod
+    def _complete(response: Dict[str, Any]) -> bool:
+        """Whether every source answered normally, so the response may be cached."""
+        return not response["dropped_sources"] and not response["degraded_sources"]
+
+    async def _rank(self, query_text: str, merged: List[SearchResult], providers: List, top_k: int,
+                    warnings: List[str], stats: Optional[CorpusStats] = None) -> List[dict]:
+        if SBERT_AVAILABLE and self.reranker:
             try:
-                for q in queries or [comment]:
-                    hits = prov.search(q, k=10)
-                    raw_candidates.extend(hits)
+                # Encoding is CPU-bound; keep it off the shared event loop.
+                scored = await asyncio.to_thread(self._sbert_score, query_text, merged, providers)
+                return self._recommendations(scored, top_k)
             except Exception as e:
-                warnings.append(f"Provider {getattr(prov, 'name', str(prov))} error: {e}")
+                warnings.append(f"SBERT rerank error: {e}")
+        with stage("ranking"):
+            return simple_rerank(query_text, merged, top_k, stats)
+
+    async def astream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield recommendations progressively for one comment.
+
+        A ``partial`` event with a provisional (lexical) ranking is emitted each
+        time a provider has answered all of its queries, so fast sources such as
+        the internal dataset show up immediately. A ``final`` event carries the
+        fully reranked list and the dropped sources once every provider has
+        finished or the latency budget is spent. A comment answered recently
+        (the same one, or one that means the same) gets the cached answer as a
+        single ``final`` event.
+        """
+        start = time.perf_counter()
+        is_debug = bool((payload.get("settings") or {}).get("debug"))
+        try:
+            if is_debug:
+                async for event in self._astream(payload):
+                    yield event
+                return
+            key = self._response_key(payload)
+            hit = response_cache.get(key)
+            semantic_key = None
+            if hit is None:
+                hit, semantic_key = await self._semantic_lookup(payload)
+            if hit is not None:
+                yield dict(copy.deepcopy(hit), event="final")
+                return
+            async for event in self._astream(payload):
+                if event["event"] == "final":
+                    response = {k: v for k, v in event.items() if k != "event"}
+                    if self._complete(response):
+                        response_cache.put(key, copy.deepcopy(response))
+                        if semantic_key is not None:
+                            semantic_cache.put(*semantic_key, copy.deepcopy(response))
+                yield event
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="stream")
+
+    async def _astream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        comment = payload.get("comment", "") or ""
+        tags = payload.get("tags") or []
+        opts = self._options(payload.get("settings") or {})
+        top_k = opts["top_k"]
+
+        queries, query_text, extraction = self._plan(comment, tags, opts["max_queries"])
+        providers, stats = await asyncio.to_thread(self._prepare, opts)
+        pairs = self._pairs(providers, queries or [comment], comment)
+        degraded = set()
+        tasks = [asyncio.ensure_future(self._search(prov, q, opts["hedge_after_s"], degraded)) for prov, q in pairs]
+        task_index = {task: i for i, task in enumerate(tasks)}
+        outstanding: Dict[str, int] = {}
+        for prov, _ in pairs:
+            name = getattr(prov, 'name', str(prov))
+            outstanding[name] = outstanding.get(name, 0) + 1
 
-        seen = set()
-        merged: List[SearchResult] = []
-        for c in raw_candidates:
-            if c.url and c.url not in seen:
-                merged.append(c)
-                seen.add(c.url)
-        merged = merged[:200]
+        warnings = []
+        results: List[Optional[List[SearchResult]]] = [None] * len(tasks)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + opts["budget_s"]
+        pending = set(tasks)
+        try:
+            while pending:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                finished = []
+                for task in done:
+                    i = task_index[task]
+                    name = getattr(pairs[i][0], 'name', str(pairs[i][0]))
+                    if task.exception() is not None:
+                        PROVIDER_ERRORS.inc(provider=name)
+                        warnings.append(f"Provider {name} error: {_error_text(task.exception())}")
+                        degraded.add(name)
+                        results[i] = []
+                    else:
+                        results[i] = task.result()
+                    outstanding[name] -= 1
+                    if outstanding[name] == 0:
+                        finished.append(name)
+                if finished:
+                    # Provisional; the final ranking records the candidate metrics once.
+                    merged = self._dedupe([c for res in results if res for c in res])
+                    yield {"event": "partial", "sources": finished,
+                           "resources": self._resources(simple_rerank(query_text, merged, top_k, stats))}
+        finally:
+            for task in pending:
+                task.cancel()
+
+        dropped_sources = [name for name, left in outstanding.items() if left > 0]
+        for name in dropped_sources:
+            PROVIDER_DROPPED.inc(outstanding[name], provider=name)
+        merged = self._merge([c for res in results if res for c in res])
+        recommendations = await self._rank(query_text, merged, providers, top_k, warnings, stats)
+        yield {"event": "final", "resources": self._resources(recommendations), "dropped_sources": dropped_sources,
+               "degraded_sources": [name for name in outstanding if name in degraded]}
+
+    def process_batch(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return run_sync(self.aprocess_batch(payload))
+
+    async def aprocess_batch(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Recommend for every comment of a PR in one pass.
+
+        ``payload`` is ``{"comments": [{"comment": ..., "tags": [...]}, ...],
+        "tags": [...], "settings": {...}}``; items may also be plain strings and
+        fall back to the shared tags. Queries shared by several comments are sent
+        once per provider, and all queries and candidates are embedded in a single
+        encoder pass. Responses come back in input order.
+
+        Raises ValueError for a malformed payload or more than
+        ``MAX_BATCH_COMMENTS`` comments.
+        """
+        start = time.perf_counter()
+        # PR-wide batches yield API quota to interactive requests.
+        priority.set("batch")
+        settings = payload.get("settings") or {}
+        if not isinstance(settings, dict):
+            raise ValueError("settings must be an object")
+        try:
+            opts = self._options(settings)
+        except TypeError as e:
+            raise ValueError(f"invalid settings: {e}") from None
+        shared_tags = self._tags(payload.get("tags"))
+        comments = payload.get("comments") or []
+        if not isinstance(comments, list):
+            raise ValueError("comments must be a list")
+        if len(comments) > MAX_BATCH_COMMENTS:
+            raise ValueError(f"at most {MAX_BATCH_COMMENTS} comments per batch")
+        items = []
+        for item in comments:
+            if isinstance(item, str):
+                items.append((item, shared_tags))
+            elif isinstance(item, dict) and isinstance(item.get("comment") or "", str):
+                items.append((item.get("comment") or "", self._tags(item.get("tags")) or shared_tags))
+            else:
+                raise ValueError("each comment must be a string or an object with a string 'comment'")
+        if not items:
+            return {"responses": [], "dropped_sources": [], "degraded_sources": []}
+
+        plans = [self._plan(comment, tags, opts["max_queries"])[:2] for comment, tags in items]
+        providers, stats = await asyncio.to_thread(self._prepare, opts)
+
+        # Unique (provider, normalized query) pairs across all comments.
+        pair_ids: Dict[Tuple[int, str], int] = {}
+        unique_pairs = []
+        item_pairs = []
+        for (comment, _), (queries, _) in zip(items, plans):
+            ids = []
+            for prov, q in self._pairs(providers, queries or [comment], comment):
+                key = (id(prov), " ".join(q.lower().split()))
+                if key not in pair_ids:
+                    pair_ids[key] = len(unique_pairs)
+                    unique_pairs.append((prov, q))
+                ids.append(pair_ids[key])
+            item_pairs.append(ids)
+
+        warnings = []
+        results, dropped_sources, degraded = await self._run_pairs(unique_pairs, warnings, budget_s=opts["budget_s"],
+                                                                   hedge_after_s=opts["hedge_after_s"])
+
+        merged_lists = []
+        item_dropped = []
+        item_degraded = []
+        for ids in item_pairs:
+            raw_candidates: List[SearchResult] = []
+            dropped = []
+            for i in ids:
+                if results[i] is None:
+                    name = getattr(unique_pairs[i][0], 'name', str(unique_pairs[i][0]))
+                    if name not in dropped:
+                        dropped.append(name)
+                else:
+                    raw_candidates.extend(results[i])
+            merged_lists.append(self._merge(raw_candidates))
+            item_dropped.append(dropped)
+            item_degraded.append(self._names(unique_pairs, degraded.intersection(ids)))
 
-        recommendations = []
+        query_texts = [query_text for _, query_text in plans]
+        top_k = opts["top_k"]
+        recommendations = None
         if SBERT_AVAILABLE and self.reranker:
             try:
-                scored = self.reranker.score(query_text, merged)
-                top = scored[:top_k]
-                for s in top:
-                    recommendations.append({
-                        "title": s[0].title,
-                        "url": s[0].url,
-                        "snippet": s[0].snippet,
-                        "score": float(s[1]),
-                        "source": s[0].source
-                    })
+                scored_lists = await asyncio.to_thread(self._sbert_score_batch, query_texts, merged_lists, providers)
+                recommendations = [self._recommendations(scored, top_k) for scored in scored_lists]
             except Exception as e:
                 warnings.append(f"SBERT rerank error: {e}")
-                recommendations = simple_rerank(query_text, merged, top_k)
-        else:
-            recommendations = simple_rerank(query_text, merged, top_k)
+        if recommendations is None:
+            recommendations = [simple_rerank(qt, merged, top_k, stats) for qt, merged in zip(query_texts, merged_lists)]
 
-        resources = []
-        for r in recommendations:
-            resources.append({
-                "title": r.get("title") if isinstance(r, dict) else getattr(r, "title", ""),
-                "url": r.get("url") if isinstance(r, dict) else getattr(r, "url", ""),
-                "source": r.get("source") if isinstance(r, dict) else getattr(r, "source", "")
-            })
-        return {"resources": resources}
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="batch")
+        return {
+            "responses": [{"resources": self._resources(recs), "dropped_sources": dropped,
+                           "degraded_sources": degraded_names}
+                          for recs, dropped, degraded_names in zip(recommendations, item_dropped, item_degraded)],
+            "dropped_sources": dropped_sources,
+            "degraded_sources": self._names(unique_pairs, degraded),
+        }
@@ -1,26 +1,128 @@
-from typing import List, Dict, Optional
+import asyncio
+import atexit
+import os
+import re
+import threading
+import time
+from itertools import chain, islice
+from typing import List, Dict, Optional, Tuple
 
 import httpx
 import yaml
 
+from .aio import run_sync
+from .quota import scheduler
 from .search import SearchResult
 
+DEFAULT_DATASET = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "data", "internal_dataset.yaml"))
+# How often (seconds) the dataset file is checked for edits; negative disables reloading.
+DATASET_POLL_S = float(os.getenv("DEVREF_DATASET_POLL_S", "2"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_async_client(name: str) -> httpx.AsyncClient:
+    """Long-lived, connection-pooled client shared by every instance of a provider."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = httpx.AsyncClient(
+                    timeout=15.0,
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                )
+                _clients[name] = client
+    return client
+
+
+async def aclose_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def close_clients(timeout: float = 5.0):
+    """Close the pooled clients on the background loop they were used on; safe to call twice."""
+    if _clients:
+        run_sync(aclose_clients(), timeout)
+
+
+# Flask's dev server and plain scripts; gunicorn workers also call this from worker_exit.
+atexit.register(close_clients)
+
 
 class BaseProvider:
     name = "base"
+    # External, quota-limited providers opt in to the shared result cache.
+    cacheable = False
 
     def search(self, query: str, k: int = 10) -> List[SearchResult]:
         raise NotImplementedError
 
+    async def asearch(self, query: str, k: int = 10) -> List[SearchResult]:
+        return await asyncio.to_thread(self.search, query, k)
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
 
 class InternalProvider(BaseProvider):
+    """Topic-keyed lookup over the internal dataset.
+
+    The seed is indexed once at construction: every topic key is tokenized
+    into a token->topics map and its entries are prebuilt as SearchResult
+    objects. A topic matches when all of its tokens occur in the query (or
+    all query tokens occur in the topic), so a lookup only touches topics
+    sharing a token with the query.
+    """
+
     name = "internal"
 
-    def __init__(self, seed: Optional[Dict] = None):
+    def __init__(self, seed: Optional[Dict] = None, previous: Optional["InternalProvider"] = None):
         self.seed = seed or {}
+        # (mtime, size) of the file this instance was parsed from, and when it was last compared.
+        self.source_stat: Optional[Tuple[int, int]] = None
+        self.checked_at = 0.0
+        self._build_index(previous)
+
+    def _build_index(self, previous: Optional["InternalProvider"] = None):
+        self._topic_order: Dict[str, int] = {}
+        self._topic_tokens: Dict[str, frozenset] = {}
+        self._topic_results: Dict[str, Tuple[SearchResult, ...]] = {}
+        self._token_topics: Dict[str, List[str]] = {}
+        previous_items = {str(kx): items for kx, items in previous.seed.items()} if previous is not None else {}
+        for kx, items in self.seed.items():
+            kx = str(kx)
+            toks = frozenset(_tokens(kx))
+            if not toks:
+                continue
+            self._topic_order[kx] = len(self._topic_order)
+            self._topic_tokens[kx] = toks
+            # On reload, topics whose entries did not change keep their prebuilt results.
+            if kx in previous_items and previous_items[kx] == items:
+                self._topic_results[kx] = previous._topic_results[kx]
+            else:
+                self._topic_results[kx] = tuple(
+                    SearchResult(
+                        title=str(it.get("title", "")),
+                        url=str(it.get("url", "")),
+                        snippet=str(it.get("snippet", "")) if it.get("snippet") else "",
+                        source=self.name
+                    )
+                    for it in items or [] if isinstance(it, dict)
+                )
+            for tok in toks:
+                self._token_topics.setdefault(tok, []).append(kx)
 
     @classmethod
-    def from_yaml(cls, path_or_file):
+    def from_yaml(cls, path_or_file, previous: Optional["InternalProvider"] = None):
         if hasattr(path_or_file, "read"):
             content = path_or_file.read()
             if isinstance(content, bytes):
@@ -29,43 +131,129 @@ class InternalProvider(BaseProvider):
         else:
             with open(path_or_file, "r", encoding="utf-8") as f:
                 data = yaml.safe_load(f)
-        return cls(seed=data or {})
+        return cls(seed=data or {}, previous=previous)
+
+    def match_topics(self, query: str) -> List[str]:
+        qtoks = frozenset(_tokens(query))
+        matched = set()
+        for tok in qtoks:
+            for kx in self._token_topics.get(tok, ()):
+                if kx in matched:
+                    continue
+                ktoks = self._topic_tokens[kx]
+                if ktoks <= qtoks or qtoks <= ktoks:
+                    matched.add(kx)
+        return sorted(matched, key=self._topic_order.__getitem__)
 
     def search(self, query: str, k: int = 10) -> List[SearchResult]:
-        key = query.lower().strip()
-        hits = []
-        for kx, items in self.seed.items():
-            if key in kx.lower() or kx.lower() in key:
-                for it in items:
-                    hits.append(SearchResult(
-                        title=str(it.get("title", "")),
-                        url=str(it.get("url", "")),
-                        snippet=str(it.get("snippet", "")) if it.get("snippet") else "",
-                        source=self.name
-                    ))
-        return hits[:k]
+        topics = self.match_topics(query)
+        return list(islice(chain.from_iterable(self._topic_results[kx] for kx in topics), k))
+
+    async def asearch(self, query: str, k: int = 10) -> List[SearchResult]:
+        # In-memory lookup; cheaper to run inline than to hop to a thread.
+        return self.search(query, k)
+
+
+_internal_providers: Dict[str, InternalProvider] = {}
+_internal_lock = threading.Lock()
+
+
+def _file_stat(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def load_internal_provider(path: str = DEFAULT_DATASET) -> InternalProvider:
+    """Parse and index a dataset once per process; later calls share the instance.
+
+    The file is stat()ed at most every DATASET_POLL_S seconds. After an edit it
+    is re-parsed, only changed topics are re-indexed, and the new instance
+    replaces the old one in a single assignment: requests holding the old
+    instance finish on a complete index.
+    """
+    path = os.path.abspath(path)
+    provider = _internal_providers.get(path)
+    if provider is not None and (DATASET_POLL_S < 0 or time.monotonic() - provider.checked_at < DATASET_POLL_S):
+        return provider
+    if provider is None:
+        _internal_lock.acquire()
+    elif not _internal_lock.acquire(blocking=False):
+        # Another thread is checking or reloading; keep serving the current index meanwhile.
+        return provider
+    try:
+        current = _internal_providers.get(path)
+        if current is None:
+            stat = _file_stat(path)
+            provider = InternalProvider.from_yaml(path)
+            provider.source_stat = stat
+        else:
+            provider = current
+            try:
+                stat = _file_stat(path)
+                if stat != current.source_stat:
+                    provider = InternalProvider.from_yaml(path, previous=current)
+                    provider.source_stat = stat
+            except Exception:
+                # A half-written or deleted file: keep the last good index and retry at the next poll.
+                provider = current
+        provider.checked_at = time.monotonic()
+        _internal_providers[path] = provider
+    finally:
+        _internal_lock.release()
+    return provider
+
+
+class InternalVectorProvider(BaseProvider):
+    """Semantic search over the internal corpus: embed the comment, query the ANN index.
+
+    Unlike topic lookup this needs no vocabulary hit, so comments such as
+    "stop blocking the main thread" still retrieve entries. It is queried
+    once with the raw comment rather than once per generated query.
+    """
+
+    name = "internal"
+    query_mode = "comment"
+
+    def __init__(self, reranker, corpus, index, nprobe: Optional[int] = None):
+        self.reranker = reranker
+        self.corpus = corpus
+        self.index = index
+        self.nprobe = nprobe
+
+    def search(self, query: str, k: int = 10) -> List[SearchResult]:
+        if not len(self.corpus):
+            return []
+        q_emb = self.reranker.encode([query])[0]
+        kwargs = {"nprobe": self.nprobe} if self.nprobe else {}
+        return [self.corpus.results[row] for row, _ in self.index.search(q_emb, k, **kwargs)]
 
 
 class GoogleProvider(BaseProvider):
     name = "google"
+    cacheable = True
 
     def __init__(self, api_key: Optional[str] = None, cse_id: Optional[str] = None):
         self.api_key = api_key
         self.cse_id = cse_id
 
+    @property
+    def cache_namespace(self) -> str:
+        # Different search engines return different results for the same query.
+        return self.cse_id or ""
+
     def search(self, query: str, k: int = 10) -> List[SearchResult]:
+        return run_sync(self.asearch(query, k))
+
+    async def asearch(self, query: str, k: int = 10) -> List[SearchResult]:
         if not self.api_key or not self.cse_id:
             return []
         url = "https://www.googleapis.com/customsearch/v1"
         params = {"q": query, "key": self.api_key, "cx": self.cse_id, "num": min(k, 10)}
-        try:
-            with httpx.Client(timeout=15.0) as client:
-                r = client.get(url, params=params)
-                r.raise_for_status()
-                data = r.json()
-        except Exception as e:
-            return []
+        # Quota, HTTP and network errors propagate so the caller can report them and fall back.
+        r = await scheduler.call(self.name, self.api_key, lambda: get_async_client(self.name).get(url, params=params))
+        return self._parse(r.json(), k)
 
+    def _parse(self, data: Dict, k: int) -> List[SearchResult]:
         items = data.get("items", []) or []
         out: List[SearchResult] = []
         for it in items[:k]:
@@ -81,22 +269,23 @@ class GoogleProvider(BaseProvider):
 
 class YouTubeProvider(BaseProvider):
     name = "youtube"
+    cacheable = True
 
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key
 
     def search(self, query: str, k: int = 10) -> List[SearchResult]:
+        return run_sync(self.asearch(query, k))
+
+    async def asearch(self, query: str, k: int = 10) -> List[SearchResult]:
+        if not self.api_key:
+            return []
         url = "https://www.googleapis.com/youtube/v3/search"
         params = {"q": query, "key": self.api_key, "part": "snippet", "type": "video", "maxResults": min(k, 10)}
-        try:
-            with httpx.Client(timeout=15.0) as client:
-                r = client.get(url, params=params)
-                if r.status_code != 200:
-                    return []
-                data = r.json()
-        except Exception as e:
-            return []
+        r = await scheduler.call(self.name, self.api_key, lambda: get_async_client(self.name).get(url, params=params))
+        return self._parse(r.json(), k)
 
+    def _parse(self, data: Dict, k: int) -> List[SearchResult]:
         items = data.get("items", []) or []
         out: List[SearchResult] = []
         for it in items[:k]:
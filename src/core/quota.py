@@ -0,0 +1,254 @@
+import asyncio
+import contextvars
+import hashlib
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import httpx
+
+from .metrics import metrics
+
+# Queued calls are granted in this order; batch work only gets tokens interactive requests are not waiting for.
+PRIORITIES = {"interactive": 0, "batch": 1}
+priority: contextvars.ContextVar[str] = contextvars.ContextVar("devref_priority", default="interactive")
+
+# Limits are per process; with N pre-forked workers each one gets 1/N of the configured QPS and budget.
+WORKERS = max(1, int(os.getenv("DEVREF_QUOTA_WORKERS", "1")))
+MAX_RETRIES = int(os.getenv("DEVREF_QUOTA_RETRIES", "2"))
+BACKOFF_BASE_S = float(os.getenv("DEVREF_QUOTA_BACKOFF_MS", "500")) / 1000.0
+BACKOFF_CAP_S = float(os.getenv("DEVREF_QUOTA_BACKOFF_CAP_MS", "30000")) / 1000.0
+
+# qps, daily budget in quota units (0 = unlimited), units per call. A YouTube search.list costs 100 units.
+_DEFAULTS = {"google": (10.0, 10000, 1), "youtube": (5.0, 10000, 100)}
+
+
+class QuotaExceeded(Exception):
+    """The daily budget for an API key is used up; no call was made."""
+
+
+class UpstreamError(Exception):
+    """The API kept answering 429/5xx, or could not be reached, after the retries."""
+
+
+class APIError(Exception):
+    """The API refused the request (a 4xx that is neither a rate limit nor a quota error).
+
+    The message names only the provider and the status; the request URL carries
+    the API key and must never reach a response or a log line.
+    """
+
+    def __init__(self, provider: str, status: int):
+        super().__init__(f"{provider} answered HTTP {status}")
+        self.provider = provider
+        self.status = status
+
+
+def _limits(provider: str) -> Tuple[float, int, int]:
+    qps, daily, cost = _DEFAULTS.get(provider, (10.0, 0, 1))
+    prefix = f"DEVREF_QUOTA_{provider.upper()}"
+    return (float(os.getenv(f"{prefix}_QPS", qps)) / WORKERS, int(os.getenv(f"{prefix}_DAILY", daily)) // WORKERS,
+            int(os.getenv(f"{prefix}_COST", cost)))
+
+
+# Google API quotas (Custom Search, YouTube Data) reset at midnight Pacific time.
+try:
+    _QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+except ZoneInfoNotFoundError:
+    # No tz database (e.g. Windows without tzdata): PST, so the day starts an hour late during DST at worst.
+    _QUOTA_TZ = timezone(timedelta(hours=-8))
+
+
+def _quota_day() -> int:
+    return datetime.now(_QUOTA_TZ).toordinal()
+
+
+class _KeyState:
+    def __init__(self, provider: str, key_id: str, qps: float, daily: int, cost: int):
+        self.provider = provider
+        self.key_id = key_id
+        self.qps = qps
+        self.daily = daily
+        self.cost = cost
+        self.tokens = max(1.0, qps)  # one second of burst
+        self.updated = time.monotonic()
+        self.day = _quota_day()
+        self.used = 0
+        self.closed_day: Optional[int] = None  # the API itself reported the daily quota as spent
+        self.paused_until = 0.0
+        self.failures = 0
+        self.waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.throttled = 0
+        self.rejected = 0
+        self.backoffs = 0
+
+    def refill(self, now: float):
+        self.tokens = min(max(1.0, self.qps), self.tokens + (now - self.updated) * self.qps)
+        self.updated = now
+        day = _quota_day()
+        if day != self.day:
+            self.day, self.used = day, 0
+
+    def exhausted(self) -> bool:
+        return self.closed_day == self.day or (bool(self.daily) and self.used + self.cost > self.daily)
+
+
+class QuotaScheduler:
+    """Per-API-key token buckets with a daily budget and a priority queue of waiting calls.
+
+    A call takes a token if one is free and nobody is queued; otherwise it
+    waits in a heap ordered by priority, then arrival, and a timer on the
+    event loop hands out tokens as they refill. After a 429/5xx the key is
+    paused for an exponentially growing, fully jittered delay (or the
+    server's Retry-After). Once the daily budget is spent, calls fail fast
+    with QuotaExceeded so callers can fall back.
+    """
+
+    def __init__(self):
+        self._states: Dict[Tuple[str, str], _KeyState] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def state(self, provider: str, api_key: str) -> _KeyState:
+        key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+        st = self._states.get((provider, key_id))
+        if st is None:
+            with self._lock:
+                st = self._states.setdefault((provider, key_id), _KeyState(provider, key_id, *_limits(provider)))
+        return st
+
+    async def acquire(self, st: _KeyState):
+        now = time.monotonic()
+        st.refill(now)
+        if st.exhausted():
+            st.rejected += 1
+            raise QuotaExceeded(f"{st.provider} daily quota of {st.daily} units used up")
+        if not st.waiting and st.tokens >= 1 and now >= st.paused_until:
+            st.tokens -= 1
+            st.used += st.cost
+            return
+        st.throttled += 1
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(st.waiting, (PRIORITIES.get(priority.get(), 0), next(self._seq), fut))
+        self._pump(st)
+        await fut
+
+    def _pump(self, st: _KeyState):
+        if st.timer is not None:
+            st.timer.cancel()
+            st.timer = None
+        now = time.monotonic()
+        st.refill(now)
+        while st.waiting:
+            fut = st.waiting[0][2]
+            if fut.done():  # caller gave up (deadline)
+                heapq.heappop(st.waiting)
+                continue
+            if st.exhausted():
+                heapq.heappop(st.waiting)
+                st.rejected += 1
+                fut.set_exception(QuotaExceeded(f"{st.provider} daily quota of {st.daily} units used up"))
+                continue
+            wait = max(st.paused_until - now, (1 - st.tokens) / st.qps if st.qps > 0 else 1.0)
+            if wait > 0:
+                st.timer = asyncio.get_running_loop().call_later(wait, self._pump, st)
+                return
+            heapq.heappop(st.waiting)
+            st.tokens -= 1
+            st.used += st.cost
+            fut.set_result(None)
+
+    def backoff(self, st: _KeyState, retry_after: Optional[float] = None):
+        st.failures += 1
+        st.backoffs += 1
+        delay = retry_after if retry_after is not None else \
+            random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * 2 ** (st.failures - 1)))
+        st.paused_until = max(st.paused_until, time.monotonic() + delay)
+
+    @staticmethod
+    def succeeded(st: _KeyState):
+        st.failures = 0
+
+    async def call(self, provider: str, api_key: str,
+                   send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Send one API request under the key's quota, retrying 429/5xx answers and network errors with backoff."""
+        st = self.state(provider, api_key)
+        failure = ""
+        for _ in range(MAX_RETRIES + 1):
+            await self.acquire(st)
+            try:
+                r = await send()
+            except httpx.TransportError as e:
+                # Connection failures and timeouts; the exception text may contain the URL, so keep only its type.
+                failure = type(e).__name__
+                self.backoff(st)
+                continue
+            reason = _error_reason(r) if r.status_code == 403 else ""
+            if reason in ("dailyLimitExceeded", "quotaExceeded"):
+                st.closed_day = st.day
+                st.rejected += 1
+                raise QuotaExceeded(f"{provider} reported its daily quota as used up")
+            if r.status_code != 429 and r.status_code < 500 and reason not in _RATE_REASONS:
+                self.succeeded(st)
+                if r.status_code >= 400:
+                    raise APIError(provider, r.status_code)
+                return r
+            failure = f"HTTP {r.status_code}"
+            self.backoff(st, _retry_after(r))
+        raise UpstreamError(f"{provider} failed with {failure} after {MAX_RETRIES + 1} attempts")
+
+    def stats(self) -> List[Dict[str, object]]:
+        return [{"provider": st.provider, "key": st.key_id, "queued": sum(not w[2].done() for w in st.waiting),
+                 "throttled": st.throttled, "rejected": st.rejected, "backoffs": st.backoffs, "used": st.used,
+                 "daily": st.daily} for st in list(self._states.values())]
+
+
+# Google APIs report per-minute rate limits as 403 with one of these reasons instead of 429.
+_RATE_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+
+def _error_reason(r: httpx.Response) -> str:
+    try:
+        errors = r.json().get("error", {}).get("errors") or [{}]
+        return str(errors[0].get("reason") or "")
+    except Exception:
+        return ""
+
+
+def _retry_after(r: httpx.Response) -> Optional[float]:
+    try:
+        return min(float(r.headers["Retry-After"]), BACKOFF_CAP_S)
+    except (KeyError, ValueError):
+        return None
+
+
+scheduler = QuotaScheduler()
+
+QUOTA_QUEUE = metrics.gauge("devref_quota_queue_depth", "API calls waiting for a rate-limit token.")
+QUOTA_THROTTLED = metrics.counter("devref_quota_throttled_total", "API calls that had to wait for a token.")
+QUOTA_REJECTED = metrics.counter("devref_quota_rejected_total", "API calls refused because the daily budget ran out.")
+QUOTA_BACKOFFS = metrics.counter("devref_quota_backoffs_total",
+                                 "429/5xx answers and network errors that paused an API key.")
+QUOTA_USED = metrics.gauge("devref_quota_used_units", "Quota units spent today, per API key.")
+QUOTA_FALLBACKS = metrics.counter("devref_quota_fallbacks_total",
+                                  "Searches answered from stale cache or the internal source instead of the API.")
+
+
+def _collect():
+    for s in scheduler.stats():
+        labels = {"provider": s["provider"], "key": s["key"]}
+        QUOTA_QUEUE.set(s["queued"], **labels)
+        QUOTA_THROTTLED.set(s["throttled"], **labels)
+        QUOTA_REJECTED.set(s["rejected"], **labels)
+        QUOTA_BACKOFFS.set(s["backoffs"], **labels)
+        QUOTA_USED.set(s["used"], **labels)
+
+
+metrics.add_collector(_collect)
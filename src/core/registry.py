@@ -0,0 +1,158 @@
+import importlib.util
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .metrics import metrics, record_startup
+
+DEFAULT_MODEL = os.getenv("DEVREF_RERANKER_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+DEFAULT_DEVICE = os.getenv("DEVREF_RERANKER_DEVICE") or None
+# "torch" runs sentence-transformers; "onnx" runs an exported (int8) model through onnxruntime.
+DEFAULT_BACKEND = os.getenv("DEVREF_RERANKER_BACKEND", "torch").lower()
+# "background" serves with the lexical reranker while the model loads; "blocking" loads before serving.
+DEFAULT_MODEL_LOAD = os.getenv("DEVREF_MODEL_LOAD", "background").lower()
+
+# Checked with find_spec so that deciding whether a backend exists never imports torch.
+_BACKEND_MODULES = {
+    "torch": ("sentence_transformers",),
+    "onnx": ("onnxruntime", "tokenizers"),
+}
+
+ModelKey = Tuple[str, Optional[str], str]
+
+
+def _load(model_name: str, device: Optional[str], backend: str):
+    if backend == "onnx":
+        from .rerank_onnx import OnnxReranker
+        return OnnxReranker(model_name=model_name, device=device)
+    if backend == "torch":
+        from .rerank_sbert import EmbeddingReranker
+        return EmbeddingReranker(model_name=model_name, device=device)
+    raise ValueError(f"unknown reranker backend {backend!r}")
+
+
+def backend_available(backend: str = DEFAULT_BACKEND) -> bool:
+    modules = _BACKEND_MODULES.get(backend)
+    if not modules:
+        return False
+    try:
+        return all(importlib.util.find_spec(m) is not None for m in modules)
+    except (ImportError, ValueError):
+        return False
+
+
+class ModelRegistry:
+    """Process-wide cache of reranker models, keyed by (model name, device, backend).
+
+    Each model is loaded at most once per process; concurrent callers asking
+    for the same key wait on the same load instead of loading it again.
+    """
+
+    def __init__(self):
+        self._models: Dict[ModelKey, object] = {}
+        self._errors: Dict[ModelKey, str] = {}
+        self._key_locks: Dict[ModelKey, threading.Lock] = {}
+        self._loading: Dict[ModelKey, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key: ModelKey) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def get_reranker(self, model_name: str = DEFAULT_MODEL, device: Optional[str] = DEFAULT_DEVICE,
+                     backend: str = DEFAULT_BACKEND, retry: bool = False, block: bool = True):
+        """Return the shared model, loading it if needed.
+
+        With block=False nothing is loaded and None is returned until the model is ready.
+        """
+        key = (model_name, device, backend)
+        model = self._models.get(key)
+        if model is not None or not block:
+            return model
+        with self._key_lock(key):
+            model = self._models.get(key)
+            if model is None:
+                # A failed load is not retried on the request path; only warmup retries.
+                if key in self._errors and not retry:
+                    raise RuntimeError(f"model {model_name} ({backend}) failed to load: {self._errors[key]}")
+                try:
+                    model = _load(model_name, device, backend)
+                except Exception as e:
+                    self._errors[key] = str(e)
+                    raise
+                self._errors.pop(key, None)
+                self._models[key] = model
+        return model
+
+    def warmup(self, specs: Optional[List[ModelKey]] = None) -> bool:
+        ok = True
+        for model_name, device, backend in specs or [(DEFAULT_MODEL, DEFAULT_DEVICE, DEFAULT_BACKEND)]:
+            try:
+                self.get_reranker(model_name, device, backend, retry=True)
+            except Exception:
+                ok = False
+        return ok
+
+    def load_in_background(self, specs: Optional[List[ModelKey]] = None,
+                           on_loaded: Optional[Callable[[], None]] = None) -> threading.Thread:
+        """Run warmup() on a daemon thread; on_loaded runs there afterwards if every model loaded."""
+        specs = specs or [(DEFAULT_MODEL, DEFAULT_DEVICE, DEFAULT_BACKEND)]
+
+        def run():
+            start = time.perf_counter()
+            try:
+                if self.warmup(specs) and on_loaded is not None:
+                    on_loaded()
+            finally:
+                record_startup("model", time.perf_counter() - start)
+                with self._lock:
+                    for key in specs:
+                        self._loading.pop(key, None)
+
+        thread = threading.Thread(target=run, name="devref-model-loader", daemon=True)
+        with self._lock:
+            for key in specs:
+                self._loading[key] = thread
+        thread.start()
+        return thread
+
+    def is_loading(self, model_name: str = DEFAULT_MODEL, device: Optional[str] = DEFAULT_DEVICE,
+                   backend: str = DEFAULT_BACKEND) -> bool:
+        return (model_name, device, backend) in self._loading
+
+    def is_loaded(self, model_name: str = DEFAULT_MODEL, device: Optional[str] = DEFAULT_DEVICE,
+                  backend: str = DEFAULT_BACKEND) -> bool:
+        return (model_name, device, backend) in self._models
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "loaded": [{"model": m, "device": d, "backend": b} for m, d, b in list(self._models)],
+            "loading": [{"model": m, "device": d, "backend": b} for m, d, b in list(self._loading)],
+            # Load errors can quote paths or credentials, so only which models failed is reported.
+            "failed": [{"model": m, "device": d, "backend": b} for m, d, b in list(self._errors)],
+        }
+
+
+registry = ModelRegistry()
+
+ENCODER_BATCHES = metrics.counter("devref_encoder_batches_total", "Batched encode calls run by the encoder worker.")
+ENCODER_TEXTS = metrics.counter("devref_encoder_texts_total", "Texts encoded by the encoder worker.")
+ENCODER_QUEUE = metrics.gauge("devref_encoder_queue_depth", "Encode jobs waiting for the encoder worker.")
+
+
+def _collect():
+    for (model_name, _, backend), model in list(registry._models.items()):
+        batcher = getattr(model, "batcher", None)
+        if batcher is None:
+            continue
+        stats = batcher.stats()
+        ENCODER_BATCHES.set(stats["batches"], model=model_name, backend=backend)
+        ENCODER_TEXTS.set(stats["texts"], model=model_name, backend=backend)
+        ENCODER_QUEUE.set(stats["queue_depth"], model=model_name, backend=backend)
+
+
+metrics.add_collector(_collect)
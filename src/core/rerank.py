@@ -1,18 +1,163 @@
-from typing import List
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 from .search import SearchResult
 
+# BM25F parameters: titles weigh more than snippets, snippets are length-normalized harder.
+K1 = float(os.getenv("DEVREF_BM25_K1", "1.2"))
+FIELD_WEIGHTS = (float(os.getenv("DEVREF_BM25_TITLE_WEIGHT", "2.0")), 1.0)
+FIELD_B = (0.5, 0.75)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+# Terms are hashed into a fixed id space rather than numbered in a vocabulary, which would keep
+# every word of every web result ever seen. Collisions at 2**24 merely merge two rare terms' counts.
+_ID_MASK = (1 << 24) - 1
+
+
+def _term_ids(terms) -> List[int]:
+    return [hash(t) & _ID_MASK for t in terms]
+
+
+@lru_cache(maxsize=8192)
+def _field_terms(text: str) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Sorted term ids, their counts and the token length of one field.
+
+    Candidates repeat across requests (internal entries, cached provider
+    results), so each field is tokenized once and kept as a sparse row.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return _EMPTY, _EMPTY.astype(np.float32), 0
+    counts = Counter(tokens)
+    ids, inverse = np.unique(np.array(_term_ids(counts), dtype=np.int64), return_inverse=True)
+    tf = np.bincount(inverse, weights=np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return ids, tf.astype(np.float32), len(tokens)
+
+
+def _document_terms(candidate: SearchResult):
+    return _field_terms(candidate.title or ""), _field_terms(candidate.snippet or "")
+
+
+class CorpusStats:
+    """Document frequencies and mean field lengths of a reference corpus (the internal dataset).
+
+    Computed once; at query time they are combined with the statistics of the
+    candidate set itself, so terms that only web results contain still get a
+    sensible IDF.
+    """
+
+    def __init__(self, documents: Sequence[SearchResult] = ()):
+        self.df: Counter = Counter()  # keyed by term id
+        self.n = 0
+        self.length_sums = [0, 0]
+        self.docs = set()  # (title, snippet) of every counted document
+        for doc in documents:
+            self._count(doc.title or "", doc.snippet or "", 1)
+
+    def _count(self, title_text: str, snippet_text: str, sign: int):
+        key = (title_text, snippet_text)
+        if (key in self.docs) == (sign > 0):
+            return
+        title, snippet = _field_terms(title_text), _field_terms(snippet_text)
+        for t in np.union1d(title[0], snippet[0]).tolist():
+            self.df[t] += sign
+            if not self.df[t]:
+                del self.df[t]
+        self.length_sums[0] += sign * title[2]
+        self.length_sums[1] += sign * snippet[2]
+        self.n += sign
+        if sign > 0:
+            self.docs.add(key)
+        else:
+            self.docs.discard(key)
+
+    def updated(self, documents: Sequence[SearchResult]) -> "CorpusStats":
+        """Statistics of ``documents``, counting only what differs from this corpus."""
+        keys = {(doc.title or "", doc.snippet or "") for doc in documents}
+        stats = CorpusStats()
+        stats.df, stats.n, stats.docs = Counter(self.df), self.n, set(self.docs)
+        stats.length_sums = list(self.length_sums)
+        for title, snippet in self.docs - keys:
+            stats._count(title, snippet, -1)
+        for title, snippet in keys - self.docs:
+            stats._count(title, snippet, 1)
+        return stats
+
+
+_stats_lock = threading.Lock()
+_stats: Dict[int, Tuple[object, CorpusStats]] = {}
+_latest: Optional[CorpusStats] = None
+
+
+def corpus_stats(provider) -> CorpusStats:
+    """BM25 statistics of an InternalProvider's entries, computed once per provider instance.
+
+    After a dataset reload they are derived from the previous version's
+    statistics, so only added and removed entries are tokenized and counted.
+    """
+    global _latest
+    cached = _stats.get(id(provider))
+    if cached is not None and cached[0] is provider:
+        return cached[1]
+    from .embed_index import corpus_entries
+    with _stats_lock:
+        cached = _stats.get(id(provider))
+        if cached is not None and cached[0] is provider:
+            return cached[1]
+        documents = corpus_entries(provider)[1]
+        stats = _latest.updated(documents) if _latest is not None else CorpusStats(documents)
+        if len(_stats) >= 8:
+            _stats.clear()
+        _stats[id(provider)] = (provider, stats)
+        _latest = stats
+    return stats
+
+
+def bm25_scores(query_text: str, candidates: List[SearchResult], stats: Optional[CorpusStats] = None) -> np.ndarray:
+    """BM25F score of every candidate for the query, as one vectorized pass over a sparse term matrix."""
+    terms = np.unique(np.array(_term_ids(set(_TOKEN_RE.findall(query_text.lower()))), dtype=np.int64))
+    if not len(terms) or not candidates:
+        return np.zeros(len(candidates), dtype=np.float32)
+    fields = [f for c in candidates for f in _document_terms(c)]  # title, snippet, title, snippet, ...
+    ids = np.concatenate([f[0] for f in fields])
+    counts = np.concatenate([f[1] for f in fields])
+    rows = np.repeat(np.arange(len(fields)), [len(f[0]) for f in fields])
+    # Only query terms can contribute, so the dense matrix has one column per query term.
+    cols = np.minimum(np.searchsorted(terms, ids), len(terms) - 1)
+    hit = terms[cols] == ids
+    tf = np.zeros((len(fields), len(terms)), dtype=np.float32)
+    tf[rows[hit], cols[hit]] = counts[hit]
+    tf = tf.reshape(len(candidates), 2, len(terms))
+    lengths = np.array([f[2] for f in fields], dtype=np.float32).reshape(len(candidates), 2)
+
+    stats = stats or CorpusStats()
+    n = stats.n + len(candidates)
+    df = np.array([stats.df.get(t, 0) for t in terms.tolist()], dtype=np.float32) + (tf.sum(axis=1) > 0).sum(axis=0)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    avg = np.maximum((np.array(stats.length_sums, dtype=np.float32) + lengths.sum(axis=0)) / n, 1.0)
+
+    b = np.array(FIELD_B, dtype=np.float32)
+    norm = 1.0 - b + b * lengths / avg  # (candidates, fields)
+    weighted = (tf / norm[:, :, None] * np.array(FIELD_WEIGHTS, dtype=np.float32)[None, :, None]).sum(axis=1)
+    return (weighted / (K1 + weighted)) @ idf
+
 
 def score_pair(query_text: str, candidate: SearchResult) -> float:
-    qs = set(query_text.lower().split())
-    cs = set((candidate.title + " " + candidate.snippet).lower().split())
-    if not qs or not cs:
-        return 0.0
-    return len(qs & cs) / len(qs)
-
-
-def rerank(query_text: str, candidates: List[SearchResult], top_k: int = 5) -> List[dict]:
-    scored = [(c, score_pair(query_text, c)) for c in candidates]
-    scored.sort(key=lambda x: x[1], reverse=True)
-    return [{"title": c.title, "url": c.url, "snippet": c.snippet, "score": float(s), "source": c.source} for c, s in
-            scored[:top_k]]
+    return float(bm25_scores(query_text, [candidate])[0])
+
+
+def rerank(query_text: str, candidates: List[SearchResult], top_k: int = 5,
+           stats: Optional[CorpusStats] = None) -> List[dict]:
+    scores = bm25_scores(query_text, candidates, stats)
+    # Stable sort keeps provider order among equal scores.
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [{"title": candidates[i].title, "url": candidates[i].url, "snippet": candidates[i].snippet,
+             "score": float(scores[i]), "source": candidates[i].source} for i in order]
@@ -0,0 +1,110 @@
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .batching import MicroBatcher
+from .cache import embedding_cache
+from .embed_index import CorpusEmbeddings, candidate_text
+from .metrics import stage
+from .search import SearchResult
+
+MICRO_BATCHING = os.getenv("DEVREF_MICROBATCH", "1") != "0"
+
+
+class BaseEmbeddingReranker:
+    """Backend-independent embedding reranker.
+
+    Subclasses load a model and implement ``_encode_batch`` (L2-normalized
+    float32 rows); caching, micro-batching, corpus lookups and scoring live
+    here. ``model_id`` identifies the vectors a backend produces and keys the
+    embedding cache and the persisted corpus index.
+    """
+
+    backend = "base"
+
+    def __init__(self, model_name: str, device: Optional[str] = None, micro_batching: bool = MICRO_BATCHING):
+        self.model_name = model_name
+        self.device = device
+        # Concurrent requests share one encoder worker that batches their texts together.
+        self.batcher = MicroBatcher(self._encode_batch) if micro_batching else None
+
+    @property
+    def model_id(self) -> str:
+        return self.model_name
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """L2-normalized float32 embeddings, one row per text."""
+        if self.batcher is not None:
+            return self.batcher(texts)
+        return self._encode_batch(list(texts))
+
+    def encode_cached(self, texts: Sequence[str]) -> np.ndarray:
+        """Like encode(), but only texts missing from the shared embedding cache hit the model."""
+        texts = list(texts)
+        cached = embedding_cache.get_many(self.model_id, texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+        if missing:
+            fresh = self.encode([texts[i] for i in missing])
+            embedding_cache.put_many(self.model_id, [texts[i] for i in missing], fresh)
+            for i, vec in zip(missing, fresh):
+                cached[i] = vec
+        return np.stack(cached) if cached else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_texts(self, texts: Sequence[str], corpus: Optional[CorpusEmbeddings] = None) -> np.ndarray:
+        if corpus is None or not len(corpus):
+            return self.encode_cached(texts)
+        # Internal entries come straight from the precomputed index; only the rest are encoded.
+        rows, missing = corpus.lookup(texts)
+        embs = np.empty((len(texts), corpus.vectors.shape[1]), dtype=np.float32)
+        hit = [i for i, r in enumerate(rows) if r >= 0]
+        if hit:
+            embs[hit] = corpus.vectors[[rows[i] for i in hit]]
+        if missing:
+            embs[missing] = self.encode_cached([texts[i] for i in missing])
+        return embs
+
+    def embed_candidates(self, candidates: List[SearchResult],
+                         corpus: Optional[CorpusEmbeddings] = None) -> np.ndarray:
+        return self.embed_texts([candidate_text(c.title, c.snippet) for c in candidates], corpus)
+
+    def score_batch(self, query_texts: List[str], candidate_lists: List[List[SearchResult]],
+                    corpus: Optional[CorpusEmbeddings] = None) -> List[List[Tuple[SearchResult, float]]]:
+        """Score several (query, candidates) pairs with one encoder pass over all unique texts."""
+        index: Dict[str, int] = {}
+        texts: List[str] = []
+
+        def slot(text: str) -> int:
+            i = index.get(text)
+            if i is None:
+                i = index[text] = len(texts)
+                texts.append(text)
+            return i
+
+        q_rows = [slot(q) for q in query_texts]
+        c_rows = [[slot(candidate_text(c.title, c.snippet)) for c in cands] for cands in candidate_lists]
+        if not texts:
+            return [[] for _ in query_texts]
+        with stage("embedding"):
+            embs = self.embed_texts(texts, corpus)
+
+        out = []
+        with stage("ranking"):
+            for q_row, rows, cands in zip(q_rows, c_rows, candidate_lists):
+                if not cands:
+                    out.append([])
+                    continue
+                sims = (embs[rows] @ embs[q_row]).tolist()
+                scored = [(cands[i], float(sims[i])) for i in range(len(cands))]
+                scored.sort(key=lambda x: x[1], reverse=True)
+                out.append(scored)
+        return out
+
+    def score(self, query_text: str, candidates: List[SearchResult],
+              corpus: Optional[CorpusEmbeddings] = None) -> List[Tuple[SearchResult, float]]:
+        if not candidates:
+            return []
+        return self.score_batch([query_text], [candidates], corpus)[0]
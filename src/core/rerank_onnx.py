@@ -0,0 +1,163 @@
+import inspect
+import os
+import sys
+from typing import List, Optional, Sequence
+
+import numpy as np
+import onnxruntime as ort
+from tokenizers import Tokenizer
+
+from .rerank_base import BaseEmbeddingReranker, MICRO_BATCHING
+
+MODELS_DIR = os.getenv("DEVREF_ONNX_DIR") or os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "models"))
+INTRA_OP_THREADS = int(os.getenv("DEVREF_ONNX_THREADS", "0"))  # 0 lets onnxruntime decide
+QUANTIZE = os.getenv("DEVREF_ONNX_QUANTIZE", "1") != "0"
+MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2 truncates at 256 word pieces
+
+
+def model_dir(model_name: str, models_dir: str = MODELS_DIR) -> str:
+    return os.path.join(models_dir, model_name.replace("/", "__"))
+
+
+def export(model_name: str, out_dir: Optional[str] = None, quantize: bool = True) -> str:
+    """Export a sentence-transformers model to ONNX (and int8 via dynamic quantization).
+
+    Needs torch and transformers, so it is an offline step; serving only needs
+    onnxruntime and tokenizers. Returns the directory holding ``model.onnx``,
+    ``model.int8.onnx`` and ``tokenizer.json``.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir = out_dir or model_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class Encoder(torch.nn.Module):
+        # Fixed positional signature so tracing does not depend on forward()'s parameter order.
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(names, inputs))).last_hidden_state
+
+    dynamic = {n: {0: "batch", 1: "sequence"} for n in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the dynamo exporter; dynamic_axes needs the TorchScript one.
+        kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(Encoder(model), tuple(sample[n] for n in names), fp32_path, input_names=names,
+                          output_names=["last_hidden_state"], dynamic_axes=dynamic, opset_version=14, **kwargs)
+    if quantize:
+        quantize_dynamic(fp32_path, os.path.join(out_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+    return out_dir
+
+
+class OnnxReranker(BaseEmbeddingReranker):
+    """MiniLM embeddings through onnxruntime on CPU, optionally int8-quantized.
+
+    Pooling matches sentence-transformers (attention-masked mean, then L2
+    normalization), so scores are interchangeable with the torch backend
+    within quantization error; see ``check_parity``. Only the CPU execution
+    provider is used: a ``device`` other than None or "cpu" is rejected.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: Optional[str] = None,
+                 micro_batching: bool = MICRO_BATCHING, quantized: bool = QUANTIZE,
+                 intra_op_threads: int = INTRA_OP_THREADS, path: Optional[str] = None):
+        if device is not None and device.lower() != "cpu":
+            raise ValueError(f"the onnx backend runs on CPU only, not {device!r}")
+        path = path or model_dir(model_name)
+        onnx_file = os.path.join(path, "model.int8.onnx" if quantized else "model.onnx")
+        if not os.path.exists(onnx_file):
+            raise FileNotFoundError(f"{onnx_file} not found; run `python -m core.rerank_onnx export {model_name}`")
+        self.quantized = quantized
+        self.onnx_file = onnx_file
+        self.intra_op_threads = intra_op_threads
+        self._session = None
+        self._session_pid = None
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+        super().__init__(model_name, device=device, micro_batching=micro_batching)
+
+    @property
+    def session(self) -> "ort.InferenceSession":
+        # onnxruntime's thread pool does not survive fork(); pre-forked workers open their own session.
+        if self._session is None or self._session_pid != os.getpid():
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.intra_op_threads:
+                options.intra_op_num_threads = self.intra_op_threads
+            self._session = ort.InferenceSession(self.onnx_file, options, providers=["CPUExecutionProvider"])
+            self._session_pid = os.getpid()
+        return self._session
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.model_name}#onnx{'-int8' if self.quantized else ''}"
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+def check_parity(texts: Sequence[str], query: str, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 tolerance: float = 0.02, quantized: bool = QUANTIZE) -> float:
+    """Largest absolute difference between ONNX and torch cosine scores for ``query`` vs ``texts``.
+
+    Raises ValueError when it exceeds ``tolerance``.
+    """
+    from .rerank_sbert import EmbeddingReranker
+
+    onnx_backend = OnnxReranker(model_name, micro_batching=False, quantized=quantized)
+    torch_backend = EmbeddingReranker(model_name, micro_batching=False)
+    texts = list(texts)
+    onnx_scores = onnx_backend.encode(texts) @ onnx_backend.encode([query])[0]
+    torch_scores = torch_backend.encode(texts) @ torch_backend.encode([query])[0]
+    diff = float(np.max(np.abs(onnx_scores - torch_scores))) if texts else 0.0
+    if diff > tolerance:
+        raise ValueError(f"ONNX scores differ from torch by {diff:.4f} (> {tolerance})")
+    return diff
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+    name = sys.argv[2] if len(sys.argv) > 2 else "sentence-transformers/all-MiniLM-L6-v2"
+    if command == "export":
+        print(f"exported to {export(name, quantize=QUANTIZE)}")
+    elif command == "parity":
+        from .embed_index import corpus_entries
+        from .provider import load_internal_provider
+
+        corpus_texts, _ = corpus_entries(load_internal_provider())
+        try:
+            diff = check_parity(corpus_texts, 'use coroutines instead of rxjava', name)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(f"max score difference: {diff:.4f}")
+    else:
+        sys.exit(f"unknown command {command}; expected export or parity")
@@ -0,0 +1,40 @@
+"""Production serving: gunicorn -c gunicorn.conf.py app:app (from the src directory).
+
+With preloading (the default) the master imports the app, loads the reranker
+model, the internal dataset and its memory-mapped embeddings once, and then
+forks the workers, which share those pages copy-on-write.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("DEVREF_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("DEVREF_WORKERS") or multiprocessing.cpu_count())
+threads = int(os.getenv("DEVREF_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.getenv("DEVREF_WORKER_TIMEOUT", "60"))
+preload_app = os.getenv("DEVREF_PRELOAD", "1") != "0"
+
+if preload_app:
+    # A background loader thread in the master would not exist in the forked workers.
+    os.environ.setdefault("DEVREF_MODEL_LOAD", "blocking")
+# Split the cores between workers instead of letting every worker's BLAS/OpenMP pool use all of them.
+# Must be set before torch / onnxruntime are imported.
+_per_worker = str(max(1, multiprocessing.cpu_count() // workers))
+os.environ.setdefault("OMP_NUM_THREADS", _per_worker)
+os.environ.setdefault("DEVREF_ONNX_THREADS", _per_worker)
+# API rate limits and daily budgets are enforced per process; split them between the workers.
+os.environ.setdefault("DEVREF_QUOTA_WORKERS", str(workers))
+
+
+def when_ready(server):
+    # Objects allocated while preloading are never collected; freezing them keeps the
+    # collector from writing to (and so un-sharing) their pages in every worker.
+    if preload_app:
+        gc.freeze()
+
+
+def worker_exit(server, worker):
+    # Close the worker's pooled HTTP connections on its event loop before it exits.
+    from core.provider import close_clients
+    close_clients()
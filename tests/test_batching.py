@@ -0,0 +1,61 @@
+import threading
+
+import numpy as np
+
+from core.batching import MicroBatcher
+
+
+class _Encoder:
+    """Returns each text's index in its batch; blocks until released so jobs can queue up behind it."""
+
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+
+    def __call__(self, texts):
+        self.release.wait(5)
+        self.batches.append(list(texts))
+        return np.array([[float(t.split("-")[0]) if "-" in t else -1.0] for t in texts], dtype=np.float32)
+
+
+def _jobs(sizes):
+    return [[f"{i}-{j}" for j in range(n)] for i, n in enumerate(sizes)]
+
+
+def test_each_caller_gets_its_own_rows():
+    encoder = _Encoder()
+    batcher = MicroBatcher(encoder, max_batch=64, max_wait_ms=20)
+    futures = [batcher.submit(texts) for texts in _jobs([2, 3, 1])]
+    encoder.release.set()
+    results = [f.result(5) for f in futures]
+    assert [r[:, 0].tolist() for r in results] == [[0, 0], [1, 1, 1], [2]]
+
+
+def test_batches_never_exceed_max_batch():
+    encoder = _Encoder()
+    batcher = MicroBatcher(encoder, max_batch=10, max_wait_ms=20)
+    blocker = batcher.submit(["blocker"] * 1)
+    futures = [batcher.submit(texts) for texts in _jobs([4, 4, 4, 12, 3, 9, 1])]
+    encoder.release.set()
+    blocker.result(5)
+    assert [len(f.result(5)) for f in futures] == [4, 4, 4, 12, 3, 9, 1]
+    # Only a single job larger than max_batch may go over it, and it runs alone.
+    for batch in encoder.batches:
+        assert len(batch) <= 10 or {t.split("-")[0] for t in batch} == {"3"}
+    assert sum(len(b) for b in encoder.batches) == 1 + 37
+
+
+def test_encoder_errors_reach_every_caller_in_the_batch():
+    def fail(texts):
+        raise RuntimeError("encoder down")
+
+    batcher = MicroBatcher(fail, max_batch=8, max_wait_ms=5)
+    futures = [batcher.submit(["a"]), batcher.submit(["b"])]
+    for f in futures:
+        assert isinstance(f.exception(5), RuntimeError)
+
+
+def test_empty_job_is_answered_without_the_worker():
+    batcher = MicroBatcher(lambda texts: 1 / 0)
+    assert batcher([]).shape == (0, 0)
+    assert batcher._worker is None
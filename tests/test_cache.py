@@ -0,0 +1,73 @@
+import asyncio
+
+import numpy as np
+
+from core.cache import SemanticCache, SingleFlight
+
+
+def test_concurrent_callers_share_one_computation():
+    flight = SingleFlight(ttl=30)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    async def run():
+        return await asyncio.gather(*(flight.run("k", compute) for _ in range(5)))
+
+    assert asyncio.run(run()) == [{"answer": 42}] * 5
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 4
+    assert flight.get("k") == {"answer": 42}
+
+
+def test_uncacheable_results_are_not_kept():
+    flight = SingleFlight(ttl=30)
+
+    async def compute():
+        return {"dropped_sources": ["google"]}
+
+    asyncio.run(flight.run("k", compute, cacheable=lambda r: not r["dropped_sources"]))
+    assert flight.get("k") is None
+
+
+def test_a_caller_giving_up_does_not_cancel_the_others():
+    flight = SingleFlight(ttl=30)
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        impatient = asyncio.ensure_future(flight.run("k", compute))
+        patient = asyncio.ensure_future(flight.run("k", compute))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(run()) == "done"
+
+
+def _unit(*values):
+    v = np.array(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_semantic_cache_matches_by_similarity_within_a_scope():
+    cache = SemanticCache(ttl=60, threshold=0.9)
+    cache.put("scope-a", _unit(1, 0, 0), "first")
+    assert cache.get("scope-a", _unit(1, 0.1, 0))[0] == "first"
+    assert cache.get("scope-a", _unit(0, 1, 0)) is None
+    assert cache.get("scope-b", _unit(1, 0, 0)) is None
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = SemanticCache(maxsize=2, ttl=60, threshold=0.99)
+    cache.put("s", _unit(1, 0, 0), "x")
+    cache.put("s", _unit(0, 1, 0), "y")
+    cache.get("s", _unit(1, 0, 0))
+    cache.put("s", _unit(0, 0, 1), "z")
+    assert cache.get("s", _unit(0, 1, 0)) is None
+    assert cache.get("s", _unit(1, 0, 0))[0] == "x"
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from core.deadline import hedged_search, latencies
+
+
+class _Provider:
+    """Answers attempt ``i`` after ``plan[i][0]`` seconds, failing when ``plan[i][1]`` is False."""
+
+    def __init__(self, name, plan):
+        self.name = name
+        self.plan = list(plan)
+        self.calls = 0
+
+    async def asearch(self, query, k=10):
+        attempt = self.calls
+        self.calls += 1
+        delay, ok = self.plan[attempt]
+        await asyncio.sleep(delay)
+        if not ok:
+            raise RuntimeError(f"attempt {attempt} failed")
+        return [f"attempt {attempt}"]
+
+
+def _search(prov, hedge_after=0.05):
+    return asyncio.run(hedged_search(prov, "q", 5, hedge_after))
+
+
+def test_fast_answer_is_not_hedged():
+    prov = _Provider("hedge-fast", [(0.0, True)])
+    assert _search(prov) == ["attempt 0"]
+    assert prov.calls == 1
+
+
+def test_slow_first_attempt_loses_to_the_hedge():
+    assert _search(_Provider("hedge-slow", [(1.0, True), (0.0, True)])) == ["attempt 1"]
+
+
+def test_failed_first_attempt_waits_for_the_hedge():
+    assert _search(_Provider("hedge-fail-first", [(0.1, False), (0.2, True)])) == ["attempt 1"]
+
+
+def test_raises_only_when_every_attempt_failed():
+    with pytest.raises(RuntimeError, match="attempt 0 failed"):
+        _search(_Provider("hedge-fail-both", [(0.1, False), (0.2, False)]))
+
+
+def test_cancelled_attempts_are_not_recorded():
+    _search(_Provider("hedge-record", [(1.0, True), (0.0, True)]))
+    assert len(latencies._samples["hedge-record"]) == 1
@@ -0,0 +1,20 @@
+from core.dedup import canonical_url, dedupe
+from core.search import SearchResult
+
+
+def test_canonical_url_drops_mirrors_and_tracking():
+    assert canonical_url("https://www.example.com/post/?utm_source=x&b=2&a=1#top") == "//example.com/post?a=1&b=2"
+    assert canonical_url("https://youtu.be/abc123?si=xyz") == canonical_url("https://m.youtube.com/watch?v=abc123&t=4")
+
+
+def test_dedupe_keeps_the_first_of_each_page_and_article():
+    text = "Migrating an Android app from Dagger to Hilt step by step"
+    candidates = [
+        SearchResult(title="Dagger to Hilt", url="https://blog.example.com/hilt", snippet=text),
+        SearchResult(title="Dagger to Hilt", url="https://www.blog.example.com/hilt/?utm_medium=rss", snippet=""),
+        SearchResult(title="Dagger to Hilt", url="https://mirror.example.org/p/1", snippet=text),
+        SearchResult(title="Kotlin Flow", url="https://a.example.com/flow", snippet=""),
+        SearchResult(title="Kotlin Flow", url="https://b.example.com/flow", snippet=""),
+    ]
+    assert [c.url for c in dedupe(candidates)] == [
+        "https://blog.example.com/hilt", "https://a.example.com/flow", "https://b.example.com/flow"]
@@ -0,0 +1,52 @@
+import pytest
+
+from core.matcher import AhoCorasick
+from core.nlp import extract_topics
+
+
+def _matches(patterns, text):
+    m = AhoCorasick()
+    for p in patterns:
+        m.add(p, p)
+    return [(start, end, value) for start, end, value in m.iter_matches(text)]
+
+
+def test_finds_overlapping_patterns_in_one_pass():
+    assert sorted(_matches(["dagger", "dagger hilt", "hilt"], "use dagger hilt")) == [
+        (4, 10, "dagger"), (4, 15, "dagger hilt"), (11, 15, "hilt")]
+
+
+@pytest.mark.parametrize("text", ["i did it", "mvvm is fine", "it died", "avid reader"])
+def test_short_patterns_do_not_match_inside_words(text):
+    assert _matches(["di", "vm"], text) == []
+
+
+@pytest.mark.parametrize("text, word", [
+    ("use viewmodels", "viewmodels"),
+    ("flows here", "flows"),
+    ("avoid injecting this", "injecting"),
+    ("she prefers it", "prefers"),
+    ("we preferred it", "preferred"),
+    ("injected", "injected"),
+])
+def test_inflected_forms_match(text, word):
+    [(start, end, _)] = _matches(["viewmodel", "flow", "inject", "prefer"], text)
+    assert text[start:end] == word
+
+
+def test_left_boundary_stays_strict():
+    assert _matches(["flow"], "overflows") == []
+    assert _matches(["flow"], "flowchart") == []
+
+
+@pytest.mark.parametrize("comment, topics, intents", [
+    ("Use ViewModels and Flows here", ["flow", "viewmodel"], []),
+    ("avoid injecting this", [], ["apply-di", "avoid-pattern"]),
+    ("he prefers hilt", ["hilt"], ["replace-tech"]),
+    ("we preferred koin", ["koin"], ["replace-tech"]),
+    ("avoiding rxjava", ["rxjava"], ["avoid-pattern"]),
+    ("I did it in mvvm", ["mvvm"], []),
+])
+def test_extract_topics(comment, topics, intents):
+    extraction = extract_topics(comment)
+    assert (extraction["topics"], extraction["intents"]) == (topics, intents)
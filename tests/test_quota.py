@@ -0,0 +1,137 @@
+import asyncio
+
+import httpx
+import pytest
+
+from core import quota
+from core.quota import APIError, QuotaExceeded, QuotaScheduler, UpstreamError, priority
+
+API_KEY = "secret-key"
+URL = f"https://api.example.com/search?key={API_KEY}"
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(quota, "BACKOFF_BASE_S", 0.001)
+    monkeypatch.setattr(quota, "MAX_RETRIES", 2)
+
+
+def _call(scheduler, answers, provider="google"):
+    """Run one scheduled call against a transport that gives ``answers`` in turn; returns (result, requests)."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        answer = answers[min(len(requests), len(answers)) - 1]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await scheduler.call(provider, API_KEY, lambda: client.get(URL))
+
+    return asyncio.run(run()), requests
+
+
+def _quota_error(reason):
+    return httpx.Response(403, json={"error": {"errors": [{"reason": reason}]}})
+
+
+def test_429_is_retried_after_backoff():
+    scheduler = QuotaScheduler()
+    r, requests = _call(scheduler, [httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200)])
+    assert r.status_code == 200
+    assert len(requests) == 2
+    assert scheduler.state("google", API_KEY).backoffs == 1
+
+
+def test_rate_limit_403_is_retried():
+    r, requests = _call(QuotaScheduler(), [_quota_error("userRateLimitExceeded"), httpx.Response(200)])
+    assert r.status_code == 200
+    assert len(requests) == 2
+
+
+def test_persistent_5xx_raises_upstream_error():
+    with pytest.raises(UpstreamError, match="HTTP 503 after 3 attempts"):
+        _call(QuotaScheduler(), [httpx.Response(503)])
+
+
+def test_network_errors_are_retried_without_leaking_the_url():
+    scheduler = QuotaScheduler()
+    with pytest.raises(UpstreamError) as info:
+        _call(scheduler, [httpx.ConnectError(f"cannot reach {URL}")])
+    assert "ConnectError" in str(info.value)
+    assert API_KEY not in str(info.value)
+    r, _ = _call(scheduler, [httpx.ConnectError("down"), httpx.Response(200)])
+    assert r.status_code == 200
+
+
+def test_other_4xx_raises_api_error_without_the_key():
+    with pytest.raises(APIError) as info:
+        _call(QuotaScheduler(), [httpx.Response(400)])
+    assert str(info.value) == "google answered HTTP 400"
+
+
+def test_daily_quota_403_closes_the_key_for_the_day(monkeypatch):
+    scheduler = QuotaScheduler()
+    with pytest.raises(QuotaExceeded):
+        _call(scheduler, [_quota_error("dailyLimitExceeded")])
+    # Later calls fail fast without reaching the API...
+    with pytest.raises(QuotaExceeded):
+        _call(scheduler, [httpx.Response(200)])
+    st = scheduler.state("google", API_KEY)
+    assert st.rejected == 2
+    # ...until the quota day rolls over.
+    monkeypatch.setattr(quota, "_quota_day", lambda: st.day + 1)
+    r, requests = _call(scheduler, [httpx.Response(200)])
+    assert r.status_code == 200
+    assert len(requests) == 1
+
+
+def test_daily_budget_is_counted_in_units(monkeypatch):
+    monkeypatch.setenv("DEVREF_QUOTA_YOUTUBE_DAILY", "250")
+    scheduler = QuotaScheduler()
+    for _ in range(2):
+        _call(scheduler, [httpx.Response(200)], provider="youtube")
+    assert scheduler.state("youtube", API_KEY).used == 200
+    with pytest.raises(QuotaExceeded):
+        _call(scheduler, [httpx.Response(200)], provider="youtube")
+
+
+def test_waiting_calls_are_granted_by_priority_then_arrival():
+    scheduler = QuotaScheduler()
+    st = scheduler.state("google", API_KEY)
+    st.qps, st.tokens = 100.0, 0.0
+    order = []
+
+    async def acquire(name, level):
+        priority.set(level)
+        await scheduler.acquire(st)
+        order.append(name)
+
+    async def run():
+        tasks = [asyncio.ensure_future(acquire(name, level)) for name, level in
+                 [("batch-1", "batch"), ("batch-2", "batch"), ("interactive-1", "interactive"),
+                  ("interactive-2", "interactive")]]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["interactive-1", "interactive-2", "batch-1", "batch-2"]
+    assert st.throttled == 4
+
+
+def test_token_bucket_limits_the_rate():
+    scheduler = QuotaScheduler()
+    st = scheduler.state("google", API_KEY)
+    st.qps, st.tokens = 50.0, 1.0
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(6):
+            await scheduler.acquire(st)
+        return loop.time() - start
+
+    # One call from the burst, then five more at 50 per second.
+    assert asyncio.run(run()) >= 5 / 50 * 0.9
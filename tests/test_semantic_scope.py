@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from core import processor
+from core.cache import SemanticCache
+from core.nlp import topic_roles
+
+
+def test_same_change_in_other_words_gets_the_same_roles():
+    assert topic_roles("swap Dagger for Hilt") == ["from:dagger", "to:hilt"]
+    assert topic_roles("please use hilt, not dagger") == ["from:dagger", "to:hilt"]
+
+
+def test_opposite_changes_get_different_roles():
+    assert topic_roles("replace Hilt with Dagger") == ["from:hilt", "to:dagger"]
+    assert topic_roles("replace Hilt with Dagger") != topic_roles("please use hilt, not dagger")
+    assert topic_roles("replace Dagger with Hilt") == topic_roles("swap Dagger for Hilt")
+
+
+@pytest.mark.parametrize("comment, expected", [
+    ("Migrate from RxJava to Coroutines", ["from:rxjava", "to:coroutines"]),
+    ("don't use dagger, prefer hilt", ["from:dagger", "intent:avoid-pattern", "intent:replace-tech", "to:hilt"]),
+    ("we should use Hilt instead of Dagger", ["from:dagger", "intent:replace-tech", "to:hilt"]),
+    ("dagger vs hilt", ["topic:dagger", "topic:hilt"]),
+    ("hilt vs dagger", ["topic:dagger", "topic:hilt"]),
+])
+def test_topic_roles(comment, expected):
+    assert topic_roles(comment) == expected
+
+
+class _FakeReranker:
+    model_id = "fake"
+
+    def encode_cached(self, texts):
+        # Every comment embeds identically, so only the scope can keep answers apart.
+        return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+
+@pytest.fixture
+def recommender(monkeypatch):
+    monkeypatch.setattr(processor, "semantic_cache", SemanticCache(ttl=60))
+    return processor.Recommender(reranker=_FakeReranker())
+
+
+def _cached(recommender, first, second):
+    _, key = asyncio.run(recommender._semantic_lookup({"comment": first}))
+    processor.semantic_cache.put(*key, {"answer": first})
+    hit, _ = asyncio.run(recommender._semantic_lookup({"comment": second}))
+    return hit
+
+
+def test_equivalent_comment_hits(recommender):
+    assert _cached(recommender, "swap Dagger for Hilt", "please use hilt, not dagger") == {
+        "answer": "swap Dagger for Hilt"}
+
+
+@pytest.mark.parametrize("first, second", [
+    ("replace Hilt with Dagger", "please use hilt, not dagger"),
+    ("replace Dagger with Hilt", "replace Hilt with Dagger"),
+])
+def test_opposite_comment_misses(recommender, first, second):
+    assert _cached(recommender, first, second) is None